@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+GPT-4oの応答キャッシュと、生成した画像・音声のキャッシュ
+- ExactCache: リクエスト内容（モデル・プロンプト・パラメータ）が完全一致したら前回の応答を返す
+- SemanticCache: プロンプトの埋め込みベクトルを保存しておき、十分に似たプロンプトが来たら前回の応答を返す
+- MediaCache: 生成条件のハッシュをキーに画像・音声ファイルを保存し、条件が同じなら再生成しない
+"""
+
+import os
+import json
+import math
+import hashlib
+import shutil
+import tempfile
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# キャッシュの保存先（カレントディレクトリ基準）
+CACHE_DIR = os.getenv("GPT_CACHE_DIR", ".cache")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.95
+
+
+class ExactCache:
+    """リクエストボディのSHA-256をキーにしたファイルキャッシュ"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.directory = os.path.join(cache_dir, "exact")
+        self.enabled = True
+
+    @staticmethod
+    def cache_key(request: Dict[str, Any]) -> str:
+        """モデル・メッセージ・temperature・max_tokens などを含むリクエスト全体からキーを作る"""
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, request: Dict[str, Any]) -> Optional[str]:
+        """キャッシュがあれば応答テキストを返す"""
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(self.cache_key(request)), 'r', encoding='utf-8') as f:
+                response = json.load(f)["response"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        logger.info("完全一致キャッシュにヒット")
+        return response
+
+    def put(self, request: Dict[str, Any], response: str):
+        """応答を保存する（途中で落ちても壊れたファイルが残らないよう一時ファイル経由で置き換える）"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"response": response}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(self.cache_key(request)))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    """内積がそのままコサイン類似度になるように正規化する"""
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return vector
+    return [v / norm for v in vector]
+
+
+class SemanticCache:
+    """
+    埋め込みベクトルの近さで引くキャッシュ。
+    エントリ数はタスクファイルの数程度（数百件）なので、全件との内積で最近傍を探す。
+    scope（モデル名やコンテンツタイプ）が異なるエントリはヒットさせない。
+    """
+
+    def __init__(self, client, cache_dir: str = CACHE_DIR, threshold: float = SIMILARITY_THRESHOLD,
+                 submit: Optional[Callable[[Callable[[], Awaitable[Any]], int], Awaitable[Any]]] = None):
+        """
+        submit を渡すと、埋め込みのリクエストを submit(リクエストを作る関数, トークン見積もり) で送る
+        （呼び出し側のレート制限・リトライを通すため）。
+        """
+        self.client = client
+        self.submit = submit
+        self.threshold = threshold
+        self.path = os.path.join(cache_dir, "semantic", "responses.jsonl")
+        self.enabled = True
+        self._entries: Optional[List[Dict[str, Any]]] = None
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """保存済みのエントリを初回だけ読み込む"""
+        if self._entries is None:
+            self._entries = []
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            self._entries.append(json.loads(line))
+                logger.info(f"セマンティックキャッシュ読み込み: {len(self._entries)}件")
+        return self._entries
+
+    async def embed(self, text: str) -> List[float]:
+        """テキストの埋め込みベクトルを取得する"""
+        def request():
+            return self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        if self.submit is not None:
+            # 日本語はおおよそ1文字1トークンとして見積もる
+            response = await self.submit(request, len(text))
+        else:
+            response = await request()
+        return _normalize(response.data[0].embedding)
+
+    async def get(self, prompt: str, scope: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        最も近いエントリの類似度がしきい値以上なら (応答, 埋め込み) を返す。
+        ミス時は (None, 埋め込み) を返すので、呼び出し側はそのまま add() に渡せる。
+        無効化されている場合は埋め込みも計算せず (None, None) を返す。
+        """
+        if not self.enabled:
+            return None, None
+        embedding = await self.embed(prompt)
+        best_similarity = -1.0
+        best_response = None
+        for entry in self._load():
+            if entry["scope"] != scope:
+                continue
+            similarity = sum(a * b for a, b in zip(embedding, entry["embedding"]))
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_response = entry["response"]
+
+        if best_response is not None and best_similarity >= self.threshold:
+            logger.info(f"セマンティックキャッシュにヒット (類似度 {best_similarity:.3f})")
+            return best_response, embedding
+        return None, embedding
+
+    def add(self, embedding: List[float], response: str, scope: str):
+        """応答をキャッシュに追加し、ファイルにも追記する"""
+        if not self.enabled or embedding is None:
+            return
+        entry = {"scope": scope, "embedding": embedding, "response": response}
+        self._load().append(entry)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class MediaCache:
+    """
+    画像・音声ファイルを生成条件（モデル・プロンプトの材料・サイズなど）のSHA1で保存するキャッシュ。
+    実体は {output_dir}/.cache/{key}.png|mp3 に置き、manifest.json に「ファイル名 → キー」を記録する。
+    生成条件が変わるとキーが変わるので、manifest のキーと一致しないファイルは作り直す対象になる。
+    """
+
+    def __init__(self, output_dir: str):
+        self.directory = os.path.join(output_dir, ".cache")
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.manifest: Dict[str, str] = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.manifest = json.load(f)
+            except ValueError as e:
+                logger.warning(f"メディアキャッシュのマニフェスト読み込み失敗: {e}")
+
+    @staticmethod
+    def cache_key(*parts: Any) -> str:
+        return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def restore(self, name: str, key: str, target_path: str) -> bool:
+        """
+        キャッシュにあれば target_path に配置して True を返す。
+        キャッシュ導入前に作られたファイル（manifest に記録がない）が target_path にあれば、それを取り込む。
+        """
+        suffix = os.path.splitext(target_path)[1]
+        cached_path = self._path(key, suffix)
+        if self.manifest.get(name) == key and os.path.exists(cached_path):
+            if not os.path.exists(target_path):
+                shutil.copyfile(cached_path, target_path)
+            return True
+        if name not in self.manifest and os.path.exists(target_path):
+            self.store(name, key, target_path)
+            return True
+        return False
+
+    def store(self, name: str, key: str, source_path: str):
+        """生成したファイルをキャッシュにコピーし、manifest に記録する"""
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.copyfile(source_path, self._path(key, os.path.splitext(source_path)[1]))
+        self.manifest[name] = key
+
+    def save(self):
+        """manifest を保存する"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
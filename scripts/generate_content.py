@@ -14,36 +14,75 @@ GPT-4oを使用したH5Pコンテンツ生成スクリプト
 3. テストモード（カスタム文字を指定）:
    python scripts/generate_content.py --lesson_id test --content_type dialog_cards --output_dir src/content/test --test --test_chars "なにぬねのナニヌ"
 
+4. 複数ジョブの並列実行（マニフェスト指定）:
+   python scripts/generate_content.py --manifest jobs.json --concurrency 4
+
+5. Batch APIモード（急がない一括生成向け。料金は通常の半額）:
+   python scripts/generate_content.py --manifest jobs.json --batch
+
+6. 同じコンテンツタイプの複数ジョブを1リクエストにまとめる:
+   python scripts/generate_content.py --manifest jobs.json --multi_prompt
+
 パラメータ説明:
   --lesson_id     : レッスンの識別子（例: hiragana, katakana, lesson01）
   --content_type  : コンテンツの種類（例: dialog_cards, course_presentation）
+  --content_types : 複数のコンテンツの種類をカンマ区切りで指定（1プロセスで並列に生成）
   --task_file     : タスク指示ファイル（テストモードでは不要）
   --output_dir    : 出力ディレクトリのパス
   --test          : テストモードで実行する（数文字のみ処理）
   --test_chars    : テストモードで処理する文字（デフォルト: あいうかきアイウ）
+  --manifest      : ジョブ一覧のJSONファイル（lesson_id, content_type, task_file, output_dir のリスト）
+  --concurrency   : GPT-4oへの同時リクエスト数の上限（デフォルト: 4）
+  --batch         : OpenAI Batch APIでまとめて送信し、完了までポーリングする
+  --multi_prompt  : 同じコンテンツタイプのジョブを数件ずつ1回のリクエストにまとめる
+  --no-cache      : 応答キャッシュ（.cache/）を使わない
+  --semantic_cache: 似たプロンプトの応答も再利用する（別のレッスンの応答が返ることがあるので明示的に有効にする）
+  --compress zstd : 出力JSONを .json.zst として圧縮保存する（json_to_h5p.py はそのまま読み込める）
+
+--task_file にディレクトリを指定した場合は、その中の .md ファイルごとに1ジョブとして並列処理する
+（lesson_id はファイル名、出力先は output_dir/ファイル名 になる）。
+
+レート制限（契約Tierに合わせて環境変数で指定）:
+  OPENAI_RPM / OPENAI_TPM : チャットの1分あたりリクエスト数・トークン数（デフォルト: 500 / 200000）
+  OPENAI_IMAGES_RPM       : 画像生成の1分あたりリクエスト数（デフォルト: 50）
+  OPENAI_TTS_RPM          : 音声合成の1分あたりリクエスト数（デフォルト: 50）
+  STABILITY_RPS           : Stability AI の1秒あたりリクエスト数（デフォルト: 15）
+
+画像生成:
+  IMAGE_REQ_SIZE : dall-e-2 に依頼する画像サイズ（256/512/1024、デフォルト: 512）
+  HIGH_QUALITY=1 : dall-e-3 で 1024x1024 の画像を生成する
 """
 
 import os
+import sys
 import json
 import argparse
+import asyncio
 import re
 import logging
+import random
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
 import time
-import requests
-import platform
-from PIL import Image, ImageDraw, ImageFont
+from io import BytesIO
+import httpx
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json で代用する（遅いが結果は同じ）
+    orjson = None
+from PIL import Image
 from dotenv import load_dotenv
-from openai import OpenAI
-from pydub import AudioSegment
-from stability_sdk import client as stability_client
-from stability_sdk.interfaces.gooseai.generation.generation_pb2 import (
-    ARTIFACT_IMAGE,
-    ARTIFACT_TEXT,
-    FinishReason,
-    SAMPLER_K_DPM_2_ANCESTRAL,
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
 )
+from cache import ExactCache, MediaCache, SemanticCache
+from rate_limited_executor import RateLimiter
 
 # ロギング設定
 logging.basicConfig(
@@ -59,25 +98,131 @@ load_dotenv()
 STABILITY_API_KEY = os.getenv("STABILITY_API_KEY")
 
 # OpenAI APIクライアント設定
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 接続プールを共有してTLSハンドシェイクを使い回す（HTTP/2で並列リクエストを1接続に多重化）
+# OpenAI API だけでなく、Stability AI へのリクエストや生成画像のダウンロードもこのクライアントを使う
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+async_http_client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+# コンテンツ生成に使うモデル（キャッシュのキーにも含まれるので、切り替えると別キャッシュになる）
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# 1リクエストにまとめる場合のトークン見積もり（モデルの上限に合わせる）
+MODEL_CONTEXT_TOKENS = 128000
+MODEL_MAX_OUTPUT_TOKENS = 16384
+MULTI_PROMPT_TOKENS_PER_RESULT = 4000
+
+# コンテンツ生成・画像・音声のすべてのリクエストで共有する非同期クライアント
+# 再送は自前のリトライ（レート制限・サーキットブレーカーを通る）で行うので、SDK内部の再送は切る
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=async_http_client, max_retries=0)
+
+# 画像・音声の生成条件（メディアキャッシュのキーにも含まれる）
+# 画像は300x300に縮小して使うので、通常は dall-e-2 に IMAGE_REQ_SIZE（256/512/1024）で依頼する。
+# HIGH_QUALITY=1 のときだけ dall-e-3（1024x1024のみ対応）を使う
+HIGH_QUALITY = os.getenv("HIGH_QUALITY") == "1"
+IMAGE_REQ_SIZE = int(os.getenv("IMAGE_REQ_SIZE", "512"))
+IMAGE_MODEL = "dall-e-3" if HIGH_QUALITY else "dall-e-2"
+IMAGE_SIZE = "1024x1024" if HIGH_QUALITY else f"{IMAGE_REQ_SIZE}x{IMAGE_REQ_SIZE}"
+# dall-e-2 のプロンプトは1000文字まで
+DALLE2_MAX_PROMPT_CHARS = 1000
+TTS_MODEL = "tts-1"
+TTS_VOICE = "onyx"
+
+# 送信側のレート制限（契約Tierに合わせて環境変数で指定する）
+# チャットはRPMとTPMの両方、画像・音声はRPM、Stability AI は1秒あたりのリクエスト数で制限される
+gpt4o_rate_limiter = RateLimiter(
+    float(os.getenv("OPENAI_RPM", "500")),
+    float(os.getenv("OPENAI_TPM", "200000"))
+)
+image_rate_limiter = RateLimiter(float(os.getenv("OPENAI_IMAGES_RPM", "50")))
+tts_rate_limiter = RateLimiter(float(os.getenv("OPENAI_TTS_RPM", "50")))
+stability_rate_limiter = RateLimiter(float(os.getenv("STABILITY_RPS", "15")) * 60)
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """
+    TPMの消費量を見積もる（日本語は概ね1文字1トークン以下なので文字数で多めに見積もる）。
+    OpenAIは max_tokens も含めてTPMを数えるため、出力上限も加える。
+    """
+    return sum(len(message["content"]) for message in messages) + max_tokens
+
+# タスク指示・GPT-4o応答中の ```json ... ``` ブロック
+_JSON_BLOCK_RE = re.compile(r"```json\s*([\s\S]*?)\s*```")
+
+# 同一・類似プロンプトの応答を再利用するためのキャッシュ
+# 埋め込みのリクエストもチャットと同じレート制限・リトライを通す（call_with_retries は後で定義）
+exact_cache = ExactCache()
+semantic_cache = SemanticCache(
+    async_client,
+    submit=lambda request, token_estimate: call_with_retries(request, token_estimate, "埋め込み")
+)
+
+# 画像・音声を同時に生成する文字数の上限
+MEDIA_CONCURRENCY = 10
+# 進捗ファイルは毎文字ではなく、この文字数ごとと最後にまとめて書き出す
+PROGRESS_SAVE_INTERVAL = MEDIA_CONCURRENCY
+
+def dump_json_bytes(content: Any, indent: bool = True) -> bytes:
+    """
+    UTF-8 JSONにする（orjson があればCで高速に、なければ標準の json で）。
+    人が読まないファイルは indent=False で詰めて書く。
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(content, option=option)
+    if indent:
+        return json.dumps(content, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# orjson.JSONDecodeError は ValueError のサブクラスなので、呼び出し側は ValueError だけを捕まえればよい
+load_json = orjson.loads if orjson is not None else json.loads
+
+
+# Dialog Cards の各カードのHTML（save_json_content で format_map して使う）
+_CARD_TEMPLATE_CHAR_ONLY = "<div style='font-size: 1.5em;'><strong>{character}</strong></div>"
+_CARD_TEMPLATE_WORD = "<div style='font-size: 1.5em;'><strong>{character}</strong> - {example_word}</div>"
+_CARD_TEMPLATE_WITH_IMG = _CARD_TEMPLATE_WORD + "<div><img src='{example_image}' width='100' alt='{example_word}' /></div>"
+_ANSWER_CHAR_TEMPLATE = "<div><strong>{character}</strong></div>"
+_ANSWER_PRONUNCIATION_TEMPLATE = "<div>{pronunciation}</div>"
+_ANSWER_EXAMPLE_TEMPLATE = "<div>{example_word} ({example_reading}) - {example_meaning}</div>"
+_TIP_TEMPLATE = "{char_type_jp}の「{character}」の発音を聞いて練習しましょう"
+
+
+# カタカナのUnicodeブロック（ヴ・ヵ・ヶ・長音符なども含む）
+_KATAKANA_START, _KATAKANA_END = 0x30A0, 0x30FF
+
 
-def save_json_content(content: Dict, output_dir: str, lesson_id: str, content_type: str):
-    """生成されたJSONコンテンツを保存する"""
+def is_katakana(character: str) -> bool:
+    """1文字がカタカナかどうか"""
+    return _KATAKANA_START <= ord(character) <= _KATAKANA_END
+
+
+async def save_json_content(content: Dict, output_dir: str, lesson_id: str, content_type: str,
+                            compress: Optional[str] = None):
+    """
+    生成されたJSONコンテンツを保存する。
+    compress="zstd" の場合は .json.zst として圧縮して保存する。
+    途中で落ちても書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える。
+    """
     # 出力ディレクトリがなければ作成
     os.makedirs(output_dir, exist_ok=True)
 
     # Dialog Cardsの場合、各カードにメディアと情報を追加
     if content_type == "dialog_cards" and "cards" in content:
-        # 処理対象の文字を抽出
-        characters = []
-        for card in content["cards"]:
-            if "text" in card and len(card["text"]) == 1:  # 1文字の場合のみ画像・音声生成
-                characters.append(card["text"])
+        # 処理対象の文字を抽出（1文字の場合のみ画像・音声生成）
+        # 同じ文字のカードが複数あっても生成は1回にする（順序は保つ）
+        characters = list(dict.fromkeys(
+            card["text"] for card in content["cards"]
+            if isinstance(card.get("text"), str) and len(card["text"]) == 1
+        ))
 
         # バッチでメディアを生成
         if characters:
             logger.info(f"全{len(characters)}文字のメディア（画像・音声）を生成します")
-            media_results = generate_media_batch(characters, output_dir)
+            # 生成済みメディアのキャッシュは出力先ごとに1回だけ読み込む
+            media_cache = MediaCache(output_dir)
+            media_results = await generate_media_batch(characters, output_dir, media_cache)
 
             # 生成したメディアと情報を各カードに追加
             for card in content["cards"]:
@@ -123,31 +268,34 @@ def save_json_content(content: Dict, output_dir: str, lesson_id: str, content_ty
                         logger.warning(f"文字「{character}」のメディア生成結果が見つかりません")
                         example_image = None
 
-                    # 表面のテキストを更新（文字と例単語）
+                    pronunciation = get_indonesian_pronunciation_guide(character)
+                    fields = {
+                        "character": character,
+                        "example_word": example_word,
+                        "example_reading": example_reading,
+                        "example_meaning": example_meaning,
+                        "example_image": example_image,
+                        "pronunciation": pronunciation,
+                        "char_type_jp": 'カタカナ' if is_katakana(character) else 'ひらがな',
+                    }
+
+                    # 表面のテキストを更新（文字と例単語。例単語がない場合は文字だけ表示）
                     if example_word:
-                        card_text = f"<div style='font-size: 1.5em;'><strong>{character}</strong> - {example_word}</div>"
-                        if example_image:
-                            card_text += f"<div><img src='{example_image}' width='100' alt='{example_word}' /></div>"
-                        card["text"] = card_text
+                        card_template = _CARD_TEMPLATE_WITH_IMG if example_image else _CARD_TEMPLATE_WORD
                     else:
-                        # 例単語がない場合は文字だけ表示
-                        card["text"] = f"<div style='font-size: 1.5em;'><strong>{character}</strong></div>"
+                        card_template = _CARD_TEMPLATE_CHAR_ONLY
+                    card["text"] = card_template.format_map(fields)
 
                     # 裏面の内容をより豊かに
-                    pronunciation = get_indonesian_pronunciation_guide(character)
-
-                    answer_html = f"<div><strong>{character}</strong></div>"
+                    answer_parts = [_ANSWER_CHAR_TEMPLATE]
                     if pronunciation:
-                        answer_html += f"<div>{pronunciation}</div>"
+                        answer_parts.append(_ANSWER_PRONUNCIATION_TEMPLATE)
                     if example_word and example_reading and example_meaning:
-                        answer_html += f"<div>{example_word} ({example_reading}) - {example_meaning}</div>"
-
-                    card["answer"] = answer_html
+                        answer_parts.append(_ANSWER_EXAMPLE_TEMPLATE)
+                    card["answer"] = "".join(answer_parts).format_map(fields)
 
                     # ヒントも追加
-                    is_katakana = ord(character) >= ord('ア') and ord(character) <= ord('ン')
-                    char_type_jp = 'カタカナ' if is_katakana else 'ひらがな'
-                    card["tip"] = f"{char_type_jp}の「{character}」の発音を聞いて練習しましょう"
+                    card["tip"] = _TIP_TEMPLATE.format_map(fields)
 
     # ファイル名を生成
     file_name = f"N5_{lesson_id}_{content_type}.json"
@@ -155,80 +303,83 @@ def save_json_content(content: Dict, output_dir: str, lesson_id: str, content_ty
 
     # カードの順序をランダムに
     if content_type == "dialog_cards":
-        if "behaviour" not in content:
-            content["behaviour"] = {}
-        content["behaviour"]["randomCards"] = True
+        content.setdefault("behaviour", {})["randomCards"] = True
 
 
     # JSONを保存
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(content, f, ensure_ascii=False, indent=2)
+    data = dump_json_bytes(content)
+    if compress == "zstd":
+        import zstandard  # --compress zstd 指定時のみ必要
+        data = zstandard.ZstdCompressor(level=10).compress(data)
+        file_path += ".zst"
+
+    tmp_path = file_path + ".tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        # 書きかけの一時ファイルを残さない
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
     logger.info(f"コンテンツを保存しました: {file_path}")
     return file_path
 
 
-def generate_dalle_prompt_by_gpt4o(word, kanji, meaning, visual_cues=None):
-    """
-    GPT-4o を使って、その単語に合った DALL·E 3 向けプロンプトを動的に生成する関数。
-    DALL·E に対して、教育用で意味が直感的に伝わる、清潔かつリアルな画像を生成させるためのプロンプトを作る。
-    """
-    import openai  # 必要に応じて pip install openai
-
-    openai.api_key = "YOUR_API_KEY"  # ← ここにご自身の OpenAI API キーを設定してください
-    client = openai.OpenAI()
-
-    prompt = f"""
-あなたは語学学習教材用の画像プロンプトデザイナーです。
-以下の日本語の単語について、DALL·E 3 に与えるためのプロンプト（英語）を考えてください。
-
-【語情報】
-- 単語（ひらがな）: {word}
-- 漢字: {kanji}
-- 意味（英語）: {meaning}
-- 視覚的なヒント（任意）: {visual_cues or "特になし"}
-
-【プロンプト生成の目的】
-- DALL·E 3 に英語で与えるプロンプトとして、photo-realistic な構図で、意味が直感的に伝わる画像を生成させたい
-- 教材用途であり、学習者にとって「これがこの単語を表している」と一目で分かるビジュアルが必要
-
-【制約と禁止事項】
-- 主題（単語を表すもの）は画像の中心に、ひとつだけ配置すること
-- 背景は白または非常にソフトにぼかされたもの。余計な物は置かない
-- 主題の表面に、文字（日本語・英語・ローマ字）、記号、ロゴ、模様、装飾、アイコンを一切含めない
-- ただし、主題が新聞や書籍は例外だが、文字はぼかすか潰すこと
-- 特に漢字や意味不明な文字を鞄や服などに描かないこと（emboss, engrave, print を含めない）
-- バッグ、動物、人物などには一切装飾を加えない
-- 背景に書籍、家具、室内装飾、アート作品などを含めない
-- ファンタジー風、未来風、抽象風の構図は避け、日常的で現実的なシーンにすること
-
-【スタイル】
-- 明るく、ミニマルで、教育用途にふさわしい雰囲気
-- 親しみやすく、使いやすい写真風の構図（photo-realistic）
-
-【出力形式】
-- 出力は英語の DALL·E 用プロンプトのみとし、説明文やコメントを一切含めないこと
-
-STYLE_HINTS = (
+# DALL·E 用の画像プロンプト（教材用に、意味が一目で分かる写真風の1枚絵を指示する）
+_STYLE_HINTS = (
     "studio lighting, soft shadows, shallow depth of field, centered composition, "
     "realistic texture, minimalist, clean, aesthetic, photo-realistic, no text or symbols"
 )
-"""
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a prompt generator for educational visual content."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.6,
-        max_tokens=800
+_DALLE_TEMPLATE = (
+    "A photo-realistic image for a Japanese language-learning flashcard that makes the meaning of "
+    "the word \"{word}\" (kanji: {kanji}, meaning: {meaning}) obvious at a glance. "
+    "Visual cues: {visual_cues}. "
+    "Exactly one subject, centered, on a white or softly blurred empty background. "
+    "No text (Japanese, English or romaji), symbols, logos, patterns, decorations or icons on the subject, "
+    "including bags, clothes, animals and people; writing on a newspaper or book must be illegible. "
+    "No books, furniture, decor or artwork in the background. "
+    "Everyday, realistic scene; no fantasy, futuristic or abstract styles. "
+    "Style: {style}"
+)
+
+
+def build_image_prompt(word: str, kanji: str, meaning: str, visual_cues: Optional[str] = None) -> str:
+    """単語の情報をテンプレートに埋め込んで DALL·E 用のプロンプトを作る"""
+    return _DALLE_TEMPLATE.format(
+        word=word,
+        kanji=kanji or "none",
+        meaning=meaning or "none",
+        visual_cues=visual_cues or "none",
+        style=_STYLE_HINTS
     )
 
-    return response.choices[0].message.content.strip()
+
+def save_resized_image(image_bytes: bytes, output_path: str, size: Tuple[int, int] = (300, 300)) -> bool:
+    """
+    ダウンロードした画像をメモリ上で size にリサイズしてPNGで保存する。
+    元画像をいったんディスクに書いて開き直す往復をなくす。
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            img_resized = img.resize(size, Image.Resampling.LANCZOS)
+        img_resized.save(output_path, "PNG", optimize=True)
+        return True
+    except Exception as e:
+        logger.error(f"画像のリサイズ処理中にエラーが発生しました: {e}")
+        return False
 
 
-def generate_example_image(
+async def generate_example_image(
     word: str,
     character: str,
     character_type: str,
@@ -251,13 +402,7 @@ def generate_example_image(
         # 例：キャラクター用イメージなら "word" は単に文字そのもの or "Character"
         #     例単語なら kanji や meaning, visual_cues を活かす
 
-        # シンプルにまとめたプロンプト例
-        prompt = generate_dalle_prompt_by_gpt4o(
-            word=word,
-            kanji=kanji,
-            meaning=kanji_meaning_in_English,
-            visual_cues=visual_cues
-        )
+        prompt = build_image_prompt(word, kanji, kanji_meaning_in_English, visual_cues)
 
         # Generate a single illustration that visually represents the "{kanji}" (meaning: "{kanji_meaning_in_English}").
         # The image should be in the style of a Japanese karuta "e-fuda" intended for basic learning Japanese,
@@ -280,8 +425,8 @@ def generate_example_image(
                 "output_format": "png",
             }
 
-            try:
-                response = requests.post(
+            async def post_stability():
+                response = await async_http_client.post(
                     endpoint,
                     headers={
                         "authorization": f"Bearer {stability_key}",
@@ -290,26 +435,21 @@ def generate_example_image(
                     files={"none": ""},
                     data=data
                 )
+                # 429だけは例外にして submit() に再送させる
+                if response.status_code == 429:
+                    response.raise_for_status()
+                return response
+
+            try:
+                response = await stability_rate_limiter.submit(post_stability)
             except Exception as e:
                 logger.error(f"Stability AI へのリクエスト中にエラー: {e}")
                 return False
 
             if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                logger.info(f"Stability AIから生成したイラストを保存しました: {output_path}")
-
-                # 画像を300x300にリサイズする処理を追加
-                try:
-                    from PIL import Image
-                    with Image.open(output_path) as img:
-                        img_resized = img.resize((300, 300), Image.ANTIALIAS)
-                        img_resized.save(output_path)
-                    logger.info(f"画像を300x300にリサイズしました: {output_path}")
-                except Exception as e:
-                    logger.error(f"画像のリサイズ処理中にエラーが発生しました: {e}")
+                if not await asyncio.to_thread(save_resized_image, response.content, output_path):
                     return False
-
+                logger.info(f"Stability AIから生成したイラストを保存しました: {output_path}")
                 return True
             else:
                 try:
@@ -321,32 +461,21 @@ def generate_example_image(
 
 
         else:
-            # DALL·E 3 (OpenAI) を使う場合
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
+            # DALL·E (OpenAI) を使う場合
+            request = {"model": IMAGE_MODEL, "prompt": prompt, "size": IMAGE_SIZE, "n": 1}
+            if IMAGE_MODEL == "dall-e-3":
+                request["quality"] = "standard"
+            else:
+                request["prompt"] = prompt[:DALLE2_MAX_PROMPT_CHARS]
+            response = await image_rate_limiter.submit(
+                lambda: async_client.images.generate(**request)
             )
             image_url = response.data[0].url
-            image_response = requests.get(image_url)
+            image_response = await async_http_client.get(image_url)
             if image_response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(image_response.content)
-                logger.info(f"DALL·E 3から生成したイラストを保存しました: {output_path}")
-
-                # 画像を300x300にリサイズする処理を追加
-                try:
-                    from PIL import Image
-                    with Image.open(output_path) as img:
-                        img_resized = img.resize((300, 300), Image.ANTIALIAS)
-                        img_resized.save(output_path)
-                    logger.info(f"画像を300x300にリサイズしました: {output_path}")
-                except Exception as e:
-                    logger.error(f"画像のリサイズ処理中にエラーが発生しました: {e}")
+                if not await asyncio.to_thread(save_resized_image, image_response.content, output_path):
                     return False
-
+                logger.info(f"{IMAGE_MODEL}から生成したイラストを保存しました: {output_path}")
                 return True
             else:
                 logger.error(f"イラストのダウンロードに失敗しました: ステータスコード {image_response.status_code}")
@@ -357,509 +486,895 @@ def generate_example_image(
         logger.error(f"イラスト生成中にエラーが発生しました: {e}")
         return False
 
-def generate_audio(character: str, output_path: str, include_example: bool = True) -> bool:
-    """文字と例単語の発音音声ファイルを生成する（同期生成）"""
+async def generate_audio(character: str, output_path: str, include_example: bool = True,
+                         example_word: Optional[str] = None) -> bool:
+    """
+    文字と例単語の発音音声ファイルを生成する。
+    文字と例単語は「。。。」で間をあけて1回のリクエストで読み上げさせ、そのまま output_path に書き出す。
+    example_word を省略した場合は例単語の一覧から引く。
+    """
     try:
-        # 例単語情報の取得
-        example_info = get_example_word_and_translation(character)
-        example_word = example_info.get('word', '')
-
-        # 文字単独用ファイルパス
-        char_path = f"{os.path.splitext(output_path)[0]}_char.mp3"
-
-        # 文字の音声を生成
-        char_text = character
-        char_response = client.audio.speech.create(
-            model="tts-1",
-            voice="onyx",
-            input=char_text,
-            response_format="mp3"
-        )
-        with open(char_path, 'wb') as f:
-            f.write(char_response.content)
-
-        logger.info(f"文字の音声ファイルを作成しました: {char_path}")
+        # 例単語情報の取得（呼び出し側で引いてあればそれを使う）
+        if example_word is None:
+            example_word = get_example_word_and_translation(character).get('word', '')
 
         if include_example and example_word:
-            # 例単語用ファイルパス
-            word_path = f"{os.path.splitext(output_path)[0]}_word.mp3"
-            word_response = client.audio.speech.create(
-                model="tts-1",
-                voice="onyx",
-                input=example_word,
+            text = f"{character}。。。{example_word}"
+        else:
+            # 例単語なしの場合は文字だけ
+            text = character
+
+        response = await tts_rate_limiter.submit(
+            lambda: async_client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                input=text,
                 response_format="mp3"
             )
-            with open(word_path, 'wb') as f:
-                f.write(word_response.content)
-
-            logger.info(f"例単語の音声ファイルを作成しました: {word_path}")
-
-            # 結合
-            char_audio = AudioSegment.from_file(char_path)
-            word_audio = AudioSegment.from_file(word_path)
-            silence = AudioSegment.silent(duration=250)  # 0.25秒くらい
-            combined = char_audio + silence + word_audio
-            combined.export(output_path, format="mp3")
-
-            os.remove(char_path)
-            os.remove(word_path)
-            logger.info(f"文字音声＋例単語音声を結合し、{output_path} を作成しました。")
-        else:
-            # 例単語なしの場合は文字だけを正式パスに
-            os.rename(char_path, output_path)
+        )
+        await asyncio.to_thread(Path(output_path).write_bytes, response.content)
 
+        logger.info(f"音声ファイルを作成しました: {output_path}")
         return True
 
     except Exception as e:
         logger.error(f"音声生成中にエラーが発生: {e}")
-        # 後始末
-        char_path = f"{os.path.splitext(output_path)[0]}_char.mp3"
-        word_path = f"{os.path.splitext(output_path)[0]}_word.mp3"
-        for path in [char_path, word_path]:
-            if os.path.exists(path):
-                os.remove(path)
+        # 書きかけのファイルを残さない
+        if os.path.exists(output_path):
+            os.remove(output_path)
         return False
 
+# 各文字のインドネシア語対応発音（カードごとに作り直さないよう、読み込み時に1回だけ作る）
+_PRONUNCIATION_GUIDES = MappingProxyType({
+    # あ行
+    "あ": "a seperti dalam kata 'api'",
+    "い": "i seperti dalam kata 'ikan'",
+    "う": "u seperti dalam kata 'untuk'",
+    "え": "e seperti dalam kata 'enak'",
+    "お": "o seperti dalam kata 'obat'",
+
+    # か行
+    "か": "ka seperti dalam kata 'kamar'",
+    "き": "ki seperti dalam kata 'kita'",
+    "く": "ku seperti dalam kata 'kuda'",
+    "け": "ke seperti dalam kata 'kereta'",
+    "こ": "ko seperti dalam kata 'kopi'",
+
+    # さ行
+    "さ": "sa seperti dalam kata 'satu'",
+    "し": "shi seperti dalam kata 'siang' tapi dengan bunyi 'sh'",
+    "す": "su seperti dalam kata 'susah'",
+    "せ": "se seperti dalam kata 'sepatu'",
+    "そ": "so seperti dalam kata 'sore'",
+
+    # た行
+    "た": "ta seperti dalam kata 'tangan'",
+    "ち": "chi seperti dalam kata 'cinta' dengan sedikit sentuhan 't'",
+    "つ": "tsu seperti dalam kata 'tsunami'",
+    "て": "te seperti dalam kata 'teman'",
+    "と": "to seperti dalam kata 'tolong'",
+
+    # な行
+    "な": "na seperti dalam kata 'nama'",
+    "に": "ni seperti dalam kata 'nilai'",
+    "ぬ": "nu seperti dalam kata 'nuansa'",
+    "ね": "ne seperti dalam kata 'nenek'",
+    "の": "no seperti dalam kata 'nomor'",
+
+    # は行
+    "は": "ha seperti dalam kata 'hari'",
+    "ひ": "hi seperti dalam kata 'hijau'",
+    "ふ": "fu seperti dalam kata 'full' dalam bahasa Inggris",
+    "へ": "he seperti dalam kata 'hebat'",
+    "ほ": "ho seperti dalam kata 'hokage'",
+
+    # ま行
+    "ま": "ma seperti dalam kata 'makan'",
+    "み": "mi seperti dalam kata 'minum'",
+    "む": "mu seperti dalam kata 'muncul'",
+    "め": "me seperti dalam kata 'merah'",
+    "も": "mo seperti dalam kata 'motor'",
+
+    # や行
+    "や": "ya seperti dalam kata 'yang'",
+    "ゆ": "yu seperti dalam kata 'yudisium'",
+    "よ": "yo seperti dalam kata 'yogurt'",
+
+    # ら行
+    "ら": "ra seperti dalam kata 'ramai'",
+    "り": "ri seperti dalam kata 'ringan'",
+    "る": "ru seperti dalam kata 'rumah'",
+    "れ": "re seperti dalam kata 'resep'",
+    "ろ": "ro seperti dalam kata 'robot'",
+
+    # わ行
+    "わ": "wa seperti dalam kata 'wanita'",
+    "を": "wo seperti 'o' dalam kata 'obat'",
+    "ん": "n seperti dalam kata 'antar'",
+
+    # カタカナ（ア行）
+    "ア": "a seperti dalam kata 'api'",
+    "イ": "i seperti dalam kata 'ikan'",
+    "ウ": "u seperti dalam kata 'untuk'",
+    "エ": "e seperti dalam kata 'enak'",
+    "オ": "o seperti dalam kata 'obat'",
+
+    # カタカナ（カ行）
+    "カ": "ka seperti dalam kata 'kamar'",
+    "キ": "ki seperti dalam kata 'kita'",
+    "ク": "ku seperti dalam kata 'kuda'",
+    "ケ": "ke seperti dalam kata 'kereta'",
+    "コ": "ko seperti dalam kata 'kopi'",
+
+    # カタカナ（サ行）
+    "サ": "sa seperti dalam kata 'satu'",
+    "シ": "shi seperti dalam kata 'siang' tapi dengan bunyi 'sh'",
+    "ス": "su seperti dalam kata 'susah'",
+    "セ": "se seperti dalam kata 'sepatu'",
+    "ソ": "so seperti dalam kata 'sore'",
+
+    # カタカナ（タ行）
+    "タ": "ta seperti dalam kata 'tangan'",
+    "チ": "chi seperti dalam kata 'cinta' dengan sedikit sentuhan 't'",
+    "ツ": "tsu seperti dalam kata 'tsunami'",
+    "テ": "te seperti dalam kata 'teman'",
+    "ト": "to seperti dalam kata 'tolong'",
+
+    # カタカナ（ナ行）
+    "ナ": "na seperti dalam kata 'nama'",
+    "ニ": "ni seperti dalam kata 'nilai'",
+    "ヌ": "nu seperti dalam kata 'nuansa'",
+    "ネ": "ne seperti dalam kata 'nenek'",
+    "ノ": "no seperti dalam kata 'nomor'",
+
+    # カタカナ（ハ行）
+    "ハ": "ha seperti dalam kata 'hari'",
+    "ヒ": "hi seperti dalam kata 'hijau'",
+    "フ": "fu seperti dalam kata 'full' dalam bahasa Inggris",
+    "ヘ": "he seperti dalam kata 'hebat'",
+    "ホ": "ho seperti dalam kata 'hokage'",
+
+    # カタカナ（マ行）
+    "マ": "ma seperti dalam kata 'makan'",
+    "ミ": "mi seperti dalam kata 'minum'",
+    "ム": "mu seperti dalam kata 'muncul'",
+    "メ": "me seperti dalam kata 'merah'",
+    "モ": "mo seperti dalam kata 'motor'",
+
+    # カタカナ（ヤ行）
+    "ヤ": "ya seperti dalam kata 'yang'",
+    "ユ": "yu seperti dalam kata 'yudisium'",
+    "ヨ": "yo seperti dalam kata 'yogurt'",
+
+    # カタカナ（ラ行）
+    "ラ": "ra seperti dalam kata 'ramai'",
+    "リ": "ri seperti dalam kata 'ringan'",
+    "ル": "ru seperti dalam kata 'rumah'",
+    "レ": "re seperti dalam kata 'resep'",
+    "ロ": "ro seperti dalam kata 'robot'",
+
+    # カタカナ（ワ行）
+    "ワ": "wa seperti dalam kata 'wanita'",
+    "ヲ": "wo seperti 'o' dalam kata 'obat'",
+    "ン": "n seperti dalam kata 'antar'"
+})
+
 def get_indonesian_pronunciation_guide(character: str) -> str:
     """各文字のインドネシア語対応発音を返す (一部抜粋)"""
-    pronunciation_guides = {
-        # あ行
-        "あ": "a seperti dalam kata 'api'",
-        "い": "i seperti dalam kata 'ikan'",
-        "う": "u seperti dalam kata 'untuk'",
-        "え": "e seperti dalam kata 'enak'",
-        "お": "o seperti dalam kata 'obat'",
-
-        # か行
-        "か": "ka seperti dalam kata 'kamar'",
-        "き": "ki seperti dalam kata 'kita'",
-        "く": "ku seperti dalam kata 'kuda'",
-        "け": "ke seperti dalam kata 'kereta'",
-        "こ": "ko seperti dalam kata 'kopi'",
-
-        # さ行
-        "さ": "sa seperti dalam kata 'satu'",
-        "し": "shi seperti dalam kata 'siang' tapi dengan bunyi 'sh'",
-        "す": "su seperti dalam kata 'susah'",
-        "せ": "se seperti dalam kata 'sepatu'",
-        "そ": "so seperti dalam kata 'sore'",
-
-        # た行
-        "た": "ta seperti dalam kata 'tangan'",
-        "ち": "chi seperti dalam kata 'cinta' dengan sedikit sentuhan 't'",
-        "つ": "tsu seperti dalam kata 'tsunami'",
-        "て": "te seperti dalam kata 'teman'",
-        "と": "to seperti dalam kata 'tolong'",
-
-        # な行
-        "な": "na seperti dalam kata 'nama'",
-        "に": "ni seperti dalam kata 'nilai'",
-        "ぬ": "nu seperti dalam kata 'nuansa'",
-        "ね": "ne seperti dalam kata 'nenek'",
-        "の": "no seperti dalam kata 'nomor'",
-
-        # は行
-        "は": "ha seperti dalam kata 'hari'",
-        "ひ": "hi seperti dalam kata 'hijau'",
-        "ふ": "fu seperti dalam kata 'full' dalam bahasa Inggris",
-        "へ": "he seperti dalam kata 'hebat'",
-        "ほ": "ho seperti dalam kata 'hokage'",
-
-        # ま行
-        "ま": "ma seperti dalam kata 'makan'",
-        "み": "mi seperti dalam kata 'minum'",
-        "む": "mu seperti dalam kata 'muncul'",
-        "め": "me seperti dalam kata 'merah'",
-        "も": "mo seperti dalam kata 'motor'",
-
-        # や行
-        "や": "ya seperti dalam kata 'yang'",
-        "ゆ": "yu seperti dalam kata 'yudisium'",
-        "よ": "yo seperti dalam kata 'yogurt'",
-
-        # ら行
-        "ら": "ra seperti dalam kata 'ramai'",
-        "り": "ri seperti dalam kata 'ringan'",
-        "る": "ru seperti dalam kata 'rumah'",
-        "れ": "re seperti dalam kata 'resep'",
-        "ろ": "ro seperti dalam kata 'robot'",
-
-        # わ行
-        "わ": "wa seperti dalam kata 'wanita'",
-        "を": "wo seperti 'o' dalam kata 'obat'",
-        "ん": "n seperti dalam kata 'antar'",
-
-        # カタカナ（ア行）
-        "ア": "a seperti dalam kata 'api'",
-        "イ": "i seperti dalam kata 'ikan'",
-        "ウ": "u seperti dalam kata 'untuk'",
-        "エ": "e seperti dalam kata 'enak'",
-        "オ": "o seperti dalam kata 'obat'",
-
-        # カタカナ（カ行）
-        "カ": "ka seperti dalam kata 'kamar'",
-        "キ": "ki seperti dalam kata 'kita'",
-        "ク": "ku seperti dalam kata 'kuda'",
-        "ケ": "ke seperti dalam kata 'kereta'",
-        "コ": "ko seperti dalam kata 'kopi'",
-
-        # カタカナ（サ行）
-        "サ": "sa seperti dalam kata 'satu'",
-        "シ": "shi seperti dalam kata 'siang' tapi dengan bunyi 'sh'",
-        "ス": "su seperti dalam kata 'susah'",
-        "セ": "se seperti dalam kata 'sepatu'",
-        "ソ": "so seperti dalam kata 'sore'",
-
-        # カタカナ（タ行）
-        "タ": "ta seperti dalam kata 'tangan'",
-        "チ": "chi seperti dalam kata 'cinta' dengan sedikit sentuhan 't'",
-        "ツ": "tsu seperti dalam kata 'tsunami'",
-        "テ": "te seperti dalam kata 'teman'",
-        "ト": "to seperti dalam kata 'tolong'",
-
-        # カタカナ（ナ行）
-        "ナ": "na seperti dalam kata 'nama'",
-        "ニ": "ni seperti dalam kata 'nilai'",
-        "ヌ": "nu seperti dalam kata 'nuansa'",
-        "ネ": "ne seperti dalam kata 'nenek'",
-        "ノ": "no seperti dalam kata 'nomor'",
-
-        # カタカナ（ハ行）
-        "ハ": "ha seperti dalam kata 'hari'",
-        "ヒ": "hi seperti dalam kata 'hijau'",
-        "フ": "fu seperti dalam kata 'full' dalam bahasa Inggris",
-        "ヘ": "he seperti dalam kata 'hebat'",
-        "ホ": "ho seperti dalam kata 'hokage'",
-
-        # カタカナ（マ行）
-        "マ": "ma seperti dalam kata 'makan'",
-        "ミ": "mi seperti dalam kata 'minum'",
-        "ム": "mu seperti dalam kata 'muncul'",
-        "メ": "me seperti dalam kata 'merah'",
-        "モ": "mo seperti dalam kata 'motor'",
-
-        # カタカナ（ヤ行）
-        "ヤ": "ya seperti dalam kata 'yang'",
-        "ユ": "yu seperti dalam kata 'yudisium'",
-        "ヨ": "yo seperti dalam kata 'yogurt'",
-
-        # カタカナ（ラ行）
-        "ラ": "ra seperti dalam kata 'ramai'",
-        "リ": "ri seperti dalam kata 'ringan'",
-        "ル": "ru seperti dalam kata 'rumah'",
-        "レ": "re seperti dalam kata 'resep'",
-        "ロ": "ro seperti dalam kata 'robot'",
-
-        # カタカナ（ワ行）
-        "ワ": "wa seperti dalam kata 'wanita'",
-        "ヲ": "wo seperti 'o' dalam kata 'obat'",
-        "ン": "n seperti dalam kata 'antar'"
-    }
-    return pronunciation_guides.get(character, "")
-
-def get_example_word_and_translation(character: str) -> dict:
+    return _PRONUNCIATION_GUIDES.get(character, "")
+
+# 各文字の例単語、読み方、訳
+_CHARACTER_EXAMPLE_DATA = {
+    # あ行
+    "あ": {"word": "あめ", "reading": "ame", "meaning": "hujan (雨)", "kanji": "雨"},
+    "い": {"word": "いぬ", "reading": "inu", "meaning": "anjing (犬)", "kanji": "犬"},
+    "う": {"word": "うみ", "reading": "umi", "meaning": "laut (海)", "kanji": "海"},
+    "え": {"word": "えき", "reading": "eki", "meaning": "stasiun (駅)", "kanji": "駅"},
+    "お": {"word": "おかし", "reading": "okashi", "meaning": "permen/kue (お菓子)", "kanji": "お菓子"},
+
+    # か行
+    "か": {"word": "かばん", "reading": "kaban", "meaning": "tas (鞄)", "kanji": "鞄"},
+    "き": {"word": "きっぷ", "reading": "kippu", "meaning": "tiket (切符)", "kanji": "切符"},
+    "く": {"word": "くつ", "reading": "kutsu", "meaning": "sepatu (靴)", "kanji": "靴"},
+    "け": {"word": "けいたい", "reading": "keitai", "meaning": "telepon genggam (携帯)", "kanji": "携帯"},
+    "こ": {"word": "こども", "reading": "kodomo", "meaning": "anak (子供)", "kanji": "子供"},
+
+    # さ行
+    "さ": {"word": "さくら", "reading": "sakura", "meaning": "bunga sakura (桜)", "kanji": "桜"},
+    "し": {"word": "しんぶん", "reading": "shinbun", "meaning": "koran (新聞)", "kanji": "新聞"},
+    "す": {"word": "すし", "reading": "sushi", "meaning": "sushi (寿司)", "kanji": "寿司"},
+    "せ": {"word": "せんせい", "reading": "sensei", "meaning": "guru (先生)", "kanji": "先生"},
+    "そ": {"word": "そら", "reading": "sora", "meaning": "langit (空)", "kanji": "空"},
+
+    # た行
+    "た": {"word": "たべもの", "reading": "tabemono", "meaning": "makanan (食べ物)", "kanji": "食べ物"},
+    "ち": {"word": "ちず", "reading": "chizu", "meaning": "peta (地図)", "kanji": "地図"},
+    "つ": {"word": "つくえ", "reading": "tsukue", "meaning": "meja (机)", "kanji": "机"},
+    "て": {"word": "てがみ", "reading": "tegami", "meaning": "surat (手紙)", "kanji": "手紙"},
+    "と": {"word": "とり", "reading": "tori", "meaning": "burung (鳥)", "kanji": "鳥"},
+
+    # な行
+    "な": {"word": "なつ", "reading": "natsu", "meaning": "musim panas (夏)", "kanji": "夏", "visual_cues":"sunflowers, cicadas, fans, blue sky, watermelon", "kanji_meaning_in_English":"summer"},
+    "に": {"word": "にわ", "reading": "niwa", "meaning": "taman (庭)", "kanji": "庭"},
+    "ぬ": {"word": "ぬいぐるみ", "reading": "nuigurumi", "meaning": "boneka (縫いぐるみ)", "kanji": "縫いぐるみ"},
+    "ね": {"word": "ねこ", "reading": "neko", "meaning": "kucing (猫)", "kanji": "猫"},
+    "の": {"word": "のみもの", "reading": "nomimono", "meaning": "minuman (飲み物)", "kanji": "飲み物"},
+
+    # は行
+    "は": {"word": "はな", "reading": "hana", "meaning": "bunga (花)", "kanji": "花"},
+    "ひ": {"word": "ひと", "reading": "hito", "meaning": "orang (人)", "kanji": "人"},
+    "ふ": {"word": "ふね", "reading": "fune", "meaning": "kapal (船)", "kanji": "船"},
+    "へ": {"word": "へや", "reading": "heya", "meaning": "kamar (部屋)", "kanji": "部屋"},
+    "ほ": {"word": "ほん", "reading": "hon", "meaning": "buku (本)", "kanji": "本"},
+
+    # ま行
+    "ま": {"word": "まど", "reading": "mado", "meaning": "jendela (窓)", "kanji": "窓"},
+    "み": {"word": "みず", "reading": "mizu", "meaning": "air (水)", "kanji": "水"},
+    "む": {"word": "むし", "reading": "mushi", "meaning": "serangga (虫)", "kanji": "虫"},
+    "め": {"word": "めがね", "reading": "megane", "meaning": "kacamata (眼鏡)", "kanji": "眼鏡"},
+    "も": {"word": "もり", "reading": "mori", "meaning": "hutan (森)", "kanji": "森"},
+
+    # や行
+    "や": {"word": "やま", "reading": "yama", "meaning": "gunung (山)", "kanji": "山"},
+    "ゆ": {"word": "ゆき", "reading": "yuki", "meaning": "salju (雪)", "kanji": "雪"},
+    "よ": {"word": "よる", "reading": "yoru", "meaning": "malam (夜)", "kanji": "夜"},
+
+    # ら行
+    "ら": {"word": "らいねん", "reading": "rainen", "meaning": "tahun depan (来年)", "kanji": "来年"},
+    "り": {"word": "りんご", "reading": "ringo", "meaning": "apel (林檎)", "kanji": "林檎"},
+    "る": {"word": "るす", "reading": "rusu", "meaning": "tidak ada di rumah (留守)", "kanji": "留守"},
+    "れ": {"word": "れいぞうこ", "reading": "reizouko", "meaning": "kulkas (冷蔵庫)", "kanji": "冷蔵庫"},
+    "ろ": {"word": "ろうそく", "reading": "rousoku", "meaning": "lilin (蝋燭)", "kanji": "蝋燭"},
+
+    # わ行
+    "わ": {"word": "わたし", "reading": "watashi", "meaning": "saya (私)", "kanji": "私"},
+    "を": {"word": "をたく", "reading": "wotaku", "meaning": "otaku (ヲタク)", "kanji": "ヲタク"},
+    "ん": {"word": "んーと", "reading": "n-to", "meaning": "hmm (んーと)", "kanji": ""},
+
+    # 濁音（がぎぐげご）
+    "が": {"word": "がっこう", "reading": "gakkou", "meaning": "sekolah (学校)", "kanji": "学校"},
+    "ぎ": {"word": "ぎんこう", "reading": "ginkou", "meaning": "bank (銀行)", "kanji": "銀行"},
+    "ぐ": {"word": "ぐんて", "reading": "gunte", "meaning": "sarung tangan (軍手)", "kanji": "軍手"},
+    "げ": {"word": "げんき", "reading": "genki", "meaning": "sehat/baik (元気)", "kanji": "元気"},
+    "ご": {"word": "ごはん", "reading": "gohan", "meaning": "nasi (ご飯)", "kanji": "ご飯"},
+
+    # 濁音（ざじずぜぞ）
+    "ざ": {"word": "ざっし", "reading": "zasshi", "meaning": "majalah (雑誌)", "kanji": "雑誌"},
+    "じ": {"word": "じかん", "reading": "jikan", "meaning": "waktu (時間)", "kanji": "時間"},
+    "ず": {"word": "ずかん", "reading": "zukan", "meaning": "buku ensiklopedia (図鑑)", "kanji": "図鑑"},
+    "ぜ": {"word": "ぜんぶ", "reading": "zenbu", "meaning": "semua (全部)", "kanji": "全部"},
+    "ぞ": {"word": "ぞう", "reading": "zou", "meaning": "gajah (象)", "kanji": "象"},
+
+    # 濁音（だぢづでど）
+    "だ": {"word": "だいがく", "reading": "daigaku", "meaning": "universitas (大学)", "kanji": "大学"},
+    "ぢ": {"word": "ぢしん", "reading": "jishin", "meaning": "gempa bumi (地震)", "kanji": "地震"},
+    "づ": {"word": "づくえ", "reading": "zukue", "meaning": "meja (机)", "kanji": "机"},
+    "で": {"word": "でんわ", "reading": "denwa", "meaning": "telepon (電話)", "kanji": "電話"},
+    "ど": {"word": "どあ", "reading": "doa", "meaning": "pintu (ドア)", "kanji": "ドア"},
+
+    # 濁音（ばびぶべぼ）
+    "ば": {"word": "ばす", "reading": "basu", "meaning": "bus (バス)", "kanji": "バス"},
+    "び": {"word": "びょういん", "reading": "byouin", "meaning": "rumah sakit (病院)", "kanji": "病院"},
+    "ぶ": {"word": "ぶたにく", "reading": "butaniku", "meaning": "daging babi (豚肉)", "kanji": "豚肉"},
+    "べ": {"word": "べんとう", "reading": "bentou", "meaning": "bekal (弁当)", "kanji": "弁当"},
+    "ぼ": {"word": "ぼうし", "reading": "boushi", "meaning": "topi (帽子)", "kanji": "帽子"},
+
+    # 半濁音（ぱぴぷぺぽ）
+    "ぱ": {"word": "ぱん", "reading": "pan", "meaning": "roti (パン)", "kanji": "パン"},
+    "ぴ": {"word": "ぴあの", "reading": "piano", "meaning": "piano (ピアノ)", "kanji": "ピアノ"},
+    "ぷ": {"word": "ぷれぜんと", "reading": "purezento", "meaning": "hadiah (プレゼント)", "kanji": "プレゼント"},
+    "ぺ": {"word": "ぺん", "reading": "pen", "meaning": "pulpen (ペン)", "kanji": "ペン"},
+    "ぽ": {"word": "ぽけっと", "reading": "poketto", "meaning": "saku (ポケット)", "kanji": "ポケット"},
+
+    # カタカナ（ア行）
+    "ア": {"word": "アイス", "reading": "aisu", "meaning": "es krim", "kanji": ""},
+    "イ": {"word": "インドネシア", "reading": "indonesia", "meaning": "Indonesia", "kanji": ""},
+    "ウ": {"word": "ウール", "reading": "ūru", "meaning": "wol", "kanji": ""},
+    "エ": {"word": "エレベーター", "reading": "erebētā", "meaning": "elevator", "kanji": ""},
+    "オ": {"word": "オレンジ", "reading": "orenji", "meaning": "jeruk", "kanji": ""},
+
+    # カタカナ（カ行）
+    "カ": {"word": "カメラ", "reading": "kamera", "meaning": "kamera", "kanji": ""},
+    "キ": {"word": "キッチン", "reading": "kitchin", "meaning": "dapur", "kanji": ""},
+    "ク": {"word": "クラス", "reading": "kurasu", "meaning": "kelas", "kanji": ""},
+    "ケ": {"word": "ケーキ", "reading": "kēki", "meaning": "kue", "kanji": ""},
+    "コ": {"word": "コーヒー", "reading": "kōhī", "meaning": "kopi", "kanji": ""},
+
+    # カタカナ（サ行）
+    "サ": {"word": "サッカー", "reading": "sakkā", "meaning": "sepak bola", "kanji": ""},
+    "シ": {"word": "シャツ", "reading": "shatsu", "meaning": "kemeja", "kanji": ""},
+    "ス": {"word": "スマホ", "reading": "sumaho", "meaning": "smartphone", "kanji": ""},
+    "セ": {"word": "セーター", "reading": "sētā", "meaning": "sweater", "kanji": ""},
+    "ソ": {"word": "ソファ", "reading": "sofa", "meaning": "sofa", "kanji": ""},
+
+    # カタカナ（タ行）
+    "タ": {"word": "タクシー", "reading": "takushī", "meaning": "taksi", "kanji": ""},
+    "チ": {"word": "チケット", "reading": "chiketto", "meaning": "tiket", "kanji": ""},
+    "ツ": {"word": "ツアー", "reading": "tsuā", "meaning": "tur", "kanji": ""},
+    "テ": {"word": "テレビ", "reading": "terebi", "meaning": "televisi", "kanji": ""},
+    "ト": {"word": "トマト", "reading": "tomato", "meaning": "tomat", "kanji": ""},
+
+    # カタカナ（ナ行）
+    "ナ": {"word": "ナイフ", "reading": "naifu", "meaning": "pisau", "kanji": ""},
+    "ニ": {"word": "ニュース", "reading": "nyūsu", "meaning": "berita", "kanji": ""},
+    "ヌ": {"word": "ヌードル", "reading": "nūdoru", "meaning": "mi", "kanji": ""},
+    "ネ": {"word": "ネクタイ", "reading": "nekutai", "meaning": "dasi", "kanji": ""},
+    "ノ": {"word": "ノート", "reading": "nōto", "meaning": "buku catatan", "kanji": ""},
+
+    # カタカナ（ハ行）
+    "ハ": {"word": "ハンバーガー", "reading": "hanbāgā", "meaning": "hamburger", "kanji": ""},
+    "ヒ": {"word": "ヒーター", "reading": "hītā", "meaning": "pemanas", "kanji": ""},
+    "フ": {"word": "フルーツ", "reading": "furūtsu", "meaning": "buah", "kanji": ""},
+    "ヘ": {"word": "ヘアスタイル", "reading": "heasutairu", "meaning": "gaya rambut", "kanji": ""},
+    "ホ": {"word": "ホテル", "reading": "hoteru", "meaning": "hotel", "kanji": ""},
+
+    # カタカナ（マ行）
+    "マ": {"word": "マンゴー", "reading": "mangō", "meaning": "mangga", "kanji": ""},
+    "ミ": {"word": "ミルク", "reading": "miruku", "meaning": "susu", "kanji": ""},
+    "ム": {"word": "ムード", "reading": "mūdo", "meaning": "suasana", "kanji": ""},
+    "メ": {"word": "メール", "reading": "mēru", "meaning": "email", "kanji": ""},
+    "モ": {"word": "モデル", "reading": "moderu", "meaning": "model", "kanji": ""},
+
+    # カタカナ（ヤ行）
+    "ヤ": {"word": "ヤクルト", "reading": "yakuruto", "meaning": "yakult", "kanji": ""},
+    "ユ": {"word": "ユニフォーム", "reading": "yunifōmu", "meaning": "seragam", "kanji": ""},
+    "ヨ": {"word": "ヨーグルト", "reading": "yōguruto", "meaning": "yogurt", "kanji": ""},
+
+    # カタカナ（ラ行）
+    "ラ": {"word": "ラジオ", "reading": "rajio", "meaning": "radio", "kanji": ""},
+    "リ": {"word": "リモコン", "reading": "rimokon", "meaning": "remote control", "kanji": ""},
+    "ル": {"word": "ルーム", "reading": "rūmu", "meaning": "kamar", "kanji": ""},
+    "レ": {"word": "レストラン", "reading": "resutoran", "meaning": "restoran", "kanji": ""},
+    "ロ": {"word": "ロボット", "reading": "robotto", "meaning": "robot", "kanji": ""},
+
+    # カタカナ（ワ行）
+    "ワ": {"word": "ワイン", "reading": "wain", "meaning": "anggur", "kanji": ""},
+    "ヲ": {"word": "ヲタク", "reading": "wotaku", "meaning": "otaku", "kanji": ""},
+    "ン": {"word": "パン", "reading": "pan", "meaning": "roti", "kanji": ""},
+
+    # カタカナ濁音（ガ行）
+    "ガ": {"word": "ガム", "reading": "gamu", "meaning": "permen karet", "kanji": ""},
+    "ギ": {"word": "ギター", "reading": "gitā", "meaning": "gitar", "kanji": ""},
+    "グ": {"word": "グラス", "reading": "gurasu", "meaning": "gelas", "kanji": ""},
+    "ゲ": {"word": "ゲーム", "reading": "gēmu", "meaning": "permainan", "kanji": ""},
+    "ゴ": {"word": "ゴルフ", "reading": "gorufu", "meaning": "golf", "kanji": ""},
+
+    # カタカナ濁音（ザ行）
+    "ザ": {"word": "ザクロ", "reading": "zakuro", "meaning": "delima", "kanji": ""},
+    "ジ": {"word": "ジュース", "reading": "jūsu", "meaning": "jus", "kanji": ""},
+    "ズ": {"word": "ズボン", "reading": "zubon", "meaning": "celana panjang", "kanji": ""},
+    "ゼ": {"word": "ゼリー", "reading": "zerī", "meaning": "jeli", "kanji": ""},
+    "ゾ": {"word": "ゾウ", "reading": "zou", "meaning": "gajah", "kanji": ""},
+
+    # カタカナ濁音（ダ行）
+    "ダ": {"word": "ダンス", "reading": "dansu", "meaning": "tarian", "kanji": ""},
+    "ヂ": {"word": "ヂーゼル", "reading": "dīzeru", "meaning": "diesel", "kanji": ""},
+    "ヅ": {"word": "カヅオ", "reading": "kazuo", "meaning": "ikan cakalang", "kanji": ""},
+    "デ": {"word": "デザイン", "reading": "dezain", "meaning": "desain", "kanji": ""},
+    "ド": {"word": "ドア", "reading": "doa", "meaning": "pintu", "kanji": ""},
+
+    # カタカナ濁音（バ行）
+    "バ": {"word": "バス", "reading": "basu", "meaning": "bus", "kanji": ""},
+    "ビ": {"word": "ビール", "reading": "bīru", "meaning": "bir", "kanji": ""},
+    "ブ": {"word": "ブドウ", "reading": "budou", "meaning": "anggur", "kanji": ""},
+    "ベ": {"word": "ベッド", "reading": "beddo", "meaning": "tempat tidur", "kanji": ""},
+    "ボ": {"word": "ボール", "reading": "bōru", "meaning": "bola", "kanji": ""},
+
+    # カタカナ半濁音（パ行）
+    "パ": {"word": "パソコン", "reading": "pasokon", "meaning": "komputer", "kanji": ""},
+    "ピ": {"word": "ピザ", "reading": "piza", "meaning": "pizza", "kanji": ""},
+    "プ": {"word": "プール", "reading": "pūru", "meaning": "kolam renang", "kanji": ""},
+    "ペ": {"word": "ペン", "reading": "pen", "meaning": "pulpen", "kanji": ""},
+    "ポ": {"word": "ポケット", "reading": "poketto", "meaning": "saku", "kanji": ""}
+}
+# 呼び出し側に返す各文字の情報も書き換えられないよう、内側の辞書も読み取り専用にする
+_CHARACTER_EXAMPLES = MappingProxyType({
+    character: MappingProxyType(example) for character, example in _CHARACTER_EXAMPLE_DATA.items()
+})
+_DEFAULT_EXAMPLE = MappingProxyType({"word": "", "reading": "", "meaning": "", "kanji": ""})
+
+def get_example_word_and_translation(character: str) -> Mapping[str, str]:
     """各文字の例単語、読み方、訳を返す (一部抜粋)"""
-    character_examples = {
-        # あ行
-        "あ": {"word": "あめ", "reading": "ame", "meaning": "hujan (雨)", "kanji": "雨"},
-        "い": {"word": "いぬ", "reading": "inu", "meaning": "anjing (犬)", "kanji": "犬"},
-        "う": {"word": "うみ", "reading": "umi", "meaning": "laut (海)", "kanji": "海"},
-        "え": {"word": "えき", "reading": "eki", "meaning": "stasiun (駅)", "kanji": "駅"},
-        "お": {"word": "おかし", "reading": "okashi", "meaning": "permen/kue (お菓子)", "kanji": "お菓子"},
-
-        # か行
-        "か": {"word": "かばん", "reading": "kaban", "meaning": "tas (鞄)", "kanji": "鞄"},
-        "き": {"word": "きっぷ", "reading": "kippu", "meaning": "tiket (切符)", "kanji": "切符"},
-        "く": {"word": "くつ", "reading": "kutsu", "meaning": "sepatu (靴)", "kanji": "靴"},
-        "け": {"word": "けいたい", "reading": "keitai", "meaning": "telepon genggam (携帯)", "kanji": "携帯"},
-        "こ": {"word": "こども", "reading": "kodomo", "meaning": "anak (子供)", "kanji": "子供"},
-
-        # さ行
-        "さ": {"word": "さくら", "reading": "sakura", "meaning": "bunga sakura (桜)", "kanji": "桜"},
-        "し": {"word": "しんぶん", "reading": "shinbun", "meaning": "koran (新聞)", "kanji": "新聞"},
-        "す": {"word": "すし", "reading": "sushi", "meaning": "sushi (寿司)", "kanji": "寿司"},
-        "せ": {"word": "せんせい", "reading": "sensei", "meaning": "guru (先生)", "kanji": "先生"},
-        "そ": {"word": "そら", "reading": "sora", "meaning": "langit (空)", "kanji": "空"},
-
-        # た行
-        "た": {"word": "たべもの", "reading": "tabemono", "meaning": "makanan (食べ物)", "kanji": "食べ物"},
-        "ち": {"word": "ちず", "reading": "chizu", "meaning": "peta (地図)", "kanji": "地図"},
-        "つ": {"word": "つくえ", "reading": "tsukue", "meaning": "meja (机)", "kanji": "机"},
-        "て": {"word": "てがみ", "reading": "tegami", "meaning": "surat (手紙)", "kanji": "手紙"},
-        "と": {"word": "とり", "reading": "tori", "meaning": "burung (鳥)", "kanji": "鳥"},
-
-        # な行
-        "な": {"word": "なつ", "reading": "natsu", "meaning": "musim panas (夏)", "kanji": "夏", "visual_cues":"sunflowers, cicadas, fans, blue sky, watermelon", "kanji_meaning_in_English":"summer"},
-        "に": {"word": "にわ", "reading": "niwa", "meaning": "taman (庭)", "kanji": "庭"},
-        "ぬ": {"word": "ぬいぐるみ", "reading": "nuigurumi", "meaning": "boneka (縫いぐるみ)", "kanji": "縫いぐるみ"},
-        "ね": {"word": "ねこ", "reading": "neko", "meaning": "kucing (猫)", "kanji": "猫"},
-        "の": {"word": "のみもの", "reading": "nomimono", "meaning": "minuman (飲み物)", "kanji": "飲み物"},
-
-        # は行
-        "は": {"word": "はな", "reading": "hana", "meaning": "bunga (花)", "kanji": "花"},
-        "ひ": {"word": "ひと", "reading": "hito", "meaning": "orang (人)", "kanji": "人"},
-        "ふ": {"word": "ふね", "reading": "fune", "meaning": "kapal (船)", "kanji": "船"},
-        "へ": {"word": "へや", "reading": "heya", "meaning": "kamar (部屋)", "kanji": "部屋"},
-        "ほ": {"word": "ほん", "reading": "hon", "meaning": "buku (本)", "kanji": "本"},
-
-        # ま行
-        "ま": {"word": "まど", "reading": "mado", "meaning": "jendela (窓)", "kanji": "窓"},
-        "み": {"word": "みず", "reading": "mizu", "meaning": "air (水)", "kanji": "水"},
-        "む": {"word": "むし", "reading": "mushi", "meaning": "serangga (虫)", "kanji": "虫"},
-        "め": {"word": "めがね", "reading": "megane", "meaning": "kacamata (眼鏡)", "kanji": "眼鏡"},
-        "も": {"word": "もり", "reading": "mori", "meaning": "hutan (森)", "kanji": "森"},
-
-        # や行
-        "や": {"word": "やま", "reading": "yama", "meaning": "gunung (山)", "kanji": "山"},
-        "ゆ": {"word": "ゆき", "reading": "yuki", "meaning": "salju (雪)", "kanji": "雪"},
-        "よ": {"word": "よる", "reading": "yoru", "meaning": "malam (夜)", "kanji": "夜"},
-
-        # ら行
-        "ら": {"word": "らいねん", "reading": "rainen", "meaning": "tahun depan (来年)", "kanji": "来年"},
-        "り": {"word": "りんご", "reading": "ringo", "meaning": "apel (林檎)", "kanji": "林檎"},
-        "る": {"word": "るす", "reading": "rusu", "meaning": "tidak ada di rumah (留守)", "kanji": "留守"},
-        "れ": {"word": "れいぞうこ", "reading": "reizouko", "meaning": "kulkas (冷蔵庫)", "kanji": "冷蔵庫"},
-        "ろ": {"word": "ろうそく", "reading": "rousoku", "meaning": "lilin (蝋燭)", "kanji": "蝋燭"},
-
-        # わ行
-        "わ": {"word": "わたし", "reading": "watashi", "meaning": "saya (私)", "kanji": "私"},
-        "を": {"word": "をたく", "reading": "wotaku", "meaning": "otaku (ヲタク)", "kanji": "ヲタク"},
-        "ん": {"word": "んーと", "reading": "n-to", "meaning": "hmm (んーと)", "kanji": ""},
-
-        # 濁音（がぎぐげご）
-        "が": {"word": "がっこう", "reading": "gakkou", "meaning": "sekolah (学校)", "kanji": "学校"},
-        "ぎ": {"word": "ぎんこう", "reading": "ginkou", "meaning": "bank (銀行)", "kanji": "銀行"},
-        "ぐ": {"word": "ぐんて", "reading": "gunte", "meaning": "sarung tangan (軍手)", "kanji": "軍手"},
-        "げ": {"word": "げんき", "reading": "genki", "meaning": "sehat/baik (元気)", "kanji": "元気"},
-        "ご": {"word": "ごはん", "reading": "gohan", "meaning": "nasi (ご飯)", "kanji": "ご飯"},
-
-        # 濁音（ざじずぜぞ）
-        "ざ": {"word": "ざっし", "reading": "zasshi", "meaning": "majalah (雑誌)", "kanji": "雑誌"},
-        "じ": {"word": "じかん", "reading": "jikan", "meaning": "waktu (時間)", "kanji": "時間"},
-        "ず": {"word": "ずかん", "reading": "zukan", "meaning": "buku ensiklopedia (図鑑)", "kanji": "図鑑"},
-        "ぜ": {"word": "ぜんぶ", "reading": "zenbu", "meaning": "semua (全部)", "kanji": "全部"},
-        "ぞ": {"word": "ぞう", "reading": "zou", "meaning": "gajah (象)", "kanji": "象"},
-
-        # 濁音（だぢづでど）
-        "だ": {"word": "だいがく", "reading": "daigaku", "meaning": "universitas (大学)", "kanji": "大学"},
-        "ぢ": {"word": "ぢしん", "reading": "jishin", "meaning": "gempa bumi (地震)", "kanji": "地震"},
-        "づ": {"word": "づくえ", "reading": "zukue", "meaning": "meja (机)", "kanji": "机"},
-        "で": {"word": "でんわ", "reading": "denwa", "meaning": "telepon (電話)", "kanji": "電話"},
-        "ど": {"word": "どあ", "reading": "doa", "meaning": "pintu (ドア)", "kanji": "ドア"},
-
-        # 濁音（ばびぶべぼ）
-        "ば": {"word": "ばす", "reading": "basu", "meaning": "bus (バス)", "kanji": "バス"},
-        "び": {"word": "びょういん", "reading": "byouin", "meaning": "rumah sakit (病院)", "kanji": "病院"},
-        "ぶ": {"word": "ぶたにく", "reading": "butaniku", "meaning": "daging babi (豚肉)", "kanji": "豚肉"},
-        "べ": {"word": "べんとう", "reading": "bentou", "meaning": "bekal (弁当)", "kanji": "弁当"},
-        "ぼ": {"word": "ぼうし", "reading": "boushi", "meaning": "topi (帽子)", "kanji": "帽子"},
-
-        # 半濁音（ぱぴぷぺぽ）
-        "ぱ": {"word": "ぱん", "reading": "pan", "meaning": "roti (パン)", "kanji": "パン"},
-        "ぴ": {"word": "ぴあの", "reading": "piano", "meaning": "piano (ピアノ)", "kanji": "ピアノ"},
-        "ぷ": {"word": "ぷれぜんと", "reading": "purezento", "meaning": "hadiah (プレゼント)", "kanji": "プレゼント"},
-        "ぺ": {"word": "ぺん", "reading": "pen", "meaning": "pulpen (ペン)", "kanji": "ペン"},
-        "ぽ": {"word": "ぽけっと", "reading": "poketto", "meaning": "saku (ポケット)", "kanji": "ポケット"},
-
-        # カタカナ（ア行）
-        "ア": {"word": "アイス", "reading": "aisu", "meaning": "es krim", "kanji": ""},
-        "イ": {"word": "インドネシア", "reading": "indonesia", "meaning": "Indonesia", "kanji": ""},
-        "ウ": {"word": "ウール", "reading": "ūru", "meaning": "wol", "kanji": ""},
-        "エ": {"word": "エレベーター", "reading": "erebētā", "meaning": "elevator", "kanji": ""},
-        "オ": {"word": "オレンジ", "reading": "orenji", "meaning": "jeruk", "kanji": ""},
-
-        # カタカナ（カ行）
-        "カ": {"word": "カメラ", "reading": "kamera", "meaning": "kamera", "kanji": ""},
-        "キ": {"word": "キッチン", "reading": "kitchin", "meaning": "dapur", "kanji": ""},
-        "ク": {"word": "クラス", "reading": "kurasu", "meaning": "kelas", "kanji": ""},
-        "ケ": {"word": "ケーキ", "reading": "kēki", "meaning": "kue", "kanji": ""},
-        "コ": {"word": "コーヒー", "reading": "kōhī", "meaning": "kopi", "kanji": ""},
-
-        # カタカナ（サ行）
-        "サ": {"word": "サッカー", "reading": "sakkā", "meaning": "sepak bola", "kanji": ""},
-        "シ": {"word": "シャツ", "reading": "shatsu", "meaning": "kemeja", "kanji": ""},
-        "ス": {"word": "スマホ", "reading": "sumaho", "meaning": "smartphone", "kanji": ""},
-        "セ": {"word": "セーター", "reading": "sētā", "meaning": "sweater", "kanji": ""},
-        "ソ": {"word": "ソファ", "reading": "sofa", "meaning": "sofa", "kanji": ""},
-
-        # カタカナ（タ行）
-        "タ": {"word": "タクシー", "reading": "takushī", "meaning": "taksi", "kanji": ""},
-        "チ": {"word": "チケット", "reading": "chiketto", "meaning": "tiket", "kanji": ""},
-        "ツ": {"word": "ツアー", "reading": "tsuā", "meaning": "tur", "kanji": ""},
-        "テ": {"word": "テレビ", "reading": "terebi", "meaning": "televisi", "kanji": ""},
-        "ト": {"word": "トマト", "reading": "tomato", "meaning": "tomat", "kanji": ""},
-
-        # カタカナ（ナ行）
-        "ナ": {"word": "ナイフ", "reading": "naifu", "meaning": "pisau", "kanji": ""},
-        "ニ": {"word": "ニュース", "reading": "nyūsu", "meaning": "berita", "kanji": ""},
-        "ヌ": {"word": "ヌードル", "reading": "nūdoru", "meaning": "mi", "kanji": ""},
-        "ネ": {"word": "ネクタイ", "reading": "nekutai", "meaning": "dasi", "kanji": ""},
-        "ノ": {"word": "ノート", "reading": "nōto", "meaning": "buku catatan", "kanji": ""},
-
-        # カタカナ（ハ行）
-        "ハ": {"word": "ハンバーガー", "reading": "hanbāgā", "meaning": "hamburger", "kanji": ""},
-        "ヒ": {"word": "ヒーター", "reading": "hītā", "meaning": "pemanas", "kanji": ""},
-        "フ": {"word": "フルーツ", "reading": "furūtsu", "meaning": "buah", "kanji": ""},
-        "ヘ": {"word": "ヘアスタイル", "reading": "heasutairu", "meaning": "gaya rambut", "kanji": ""},
-        "ホ": {"word": "ホテル", "reading": "hoteru", "meaning": "hotel", "kanji": ""},
-
-        # カタカナ（マ行）
-        "マ": {"word": "マンゴー", "reading": "mangō", "meaning": "mangga", "kanji": ""},
-        "ミ": {"word": "ミルク", "reading": "miruku", "meaning": "susu", "kanji": ""},
-        "ム": {"word": "ムード", "reading": "mūdo", "meaning": "suasana", "kanji": ""},
-        "メ": {"word": "メール", "reading": "mēru", "meaning": "email", "kanji": ""},
-        "モ": {"word": "モデル", "reading": "moderu", "meaning": "model", "kanji": ""},
-
-        # カタカナ（ヤ行）
-        "ヤ": {"word": "ヤクルト", "reading": "yakuruto", "meaning": "yakult", "kanji": ""},
-        "ユ": {"word": "ユニフォーム", "reading": "yunifōmu", "meaning": "seragam", "kanji": ""},
-        "ヨ": {"word": "ヨーグルト", "reading": "yōguruto", "meaning": "yogurt", "kanji": ""},
-
-        # カタカナ（ラ行）
-        "ラ": {"word": "ラジオ", "reading": "rajio", "meaning": "radio", "kanji": ""},
-        "リ": {"word": "リモコン", "reading": "rimokon", "meaning": "remote control", "kanji": ""},
-        "ル": {"word": "ルーム", "reading": "rūmu", "meaning": "kamar", "kanji": ""},
-        "レ": {"word": "レストラン", "reading": "resutoran", "meaning": "restoran", "kanji": ""},
-        "ロ": {"word": "ロボット", "reading": "robotto", "meaning": "robot", "kanji": ""},
-
-        # カタカナ（ワ行）
-        "ワ": {"word": "ワイン", "reading": "wain", "meaning": "anggur", "kanji": ""},
-        "ヲ": {"word": "ヲタク", "reading": "wotaku", "meaning": "otaku", "kanji": ""},
-        "ン": {"word": "パン", "reading": "pan", "meaning": "roti", "kanji": ""},
-
-        # カタカナ濁音（ガ行）
-        "ガ": {"word": "ガム", "reading": "gamu", "meaning": "permen karet", "kanji": ""},
-        "ギ": {"word": "ギター", "reading": "gitā", "meaning": "gitar", "kanji": ""},
-        "グ": {"word": "グラス", "reading": "gurasu", "meaning": "gelas", "kanji": ""},
-        "ゲ": {"word": "ゲーム", "reading": "gēmu", "meaning": "permainan", "kanji": ""},
-        "ゴ": {"word": "ゴルフ", "reading": "gorufu", "meaning": "golf", "kanji": ""},
-
-        # カタカナ濁音（ザ行）
-        "ザ": {"word": "ザクロ", "reading": "zakuro", "meaning": "delima", "kanji": ""},
-        "ジ": {"word": "ジュース", "reading": "jūsu", "meaning": "jus", "kanji": ""},
-        "ズ": {"word": "ズボン", "reading": "zubon", "meaning": "celana panjang", "kanji": ""},
-        "ゼ": {"word": "ゼリー", "reading": "zerī", "meaning": "jeli", "kanji": ""},
-        "ゾ": {"word": "ゾウ", "reading": "zou", "meaning": "gajah", "kanji": ""},
-
-        # カタカナ濁音（ダ行）
-        "ダ": {"word": "ダンス", "reading": "dansu", "meaning": "tarian", "kanji": ""},
-        "ヂ": {"word": "ヂーゼル", "reading": "dīzeru", "meaning": "diesel", "kanji": ""},
-        "ヅ": {"word": "カヅオ", "reading": "kazuo", "meaning": "ikan cakalang", "kanji": ""},
-        "デ": {"word": "デザイン", "reading": "dezain", "meaning": "desain", "kanji": ""},
-        "ド": {"word": "ドア", "reading": "doa", "meaning": "pintu", "kanji": ""},
-
-        # カタカナ濁音（バ行）
-        "バ": {"word": "バス", "reading": "basu", "meaning": "bus", "kanji": ""},
-        "ビ": {"word": "ビール", "reading": "bīru", "meaning": "bir", "kanji": ""},
-        "ブ": {"word": "ブドウ", "reading": "budou", "meaning": "anggur", "kanji": ""},
-        "ベ": {"word": "ベッド", "reading": "beddo", "meaning": "tempat tidur", "kanji": ""},
-        "ボ": {"word": "ボール", "reading": "bōru", "meaning": "bola", "kanji": ""},
-
-        # カタカナ半濁音（パ行）
-        "パ": {"word": "パソコン", "reading": "pasokon", "meaning": "komputer", "kanji": ""},
-        "ピ": {"word": "ピザ", "reading": "piza", "meaning": "pizza", "kanji": ""},
-        "プ": {"word": "プール", "reading": "pūru", "meaning": "kolam renang", "kanji": ""},
-        "ペ": {"word": "ペン", "reading": "pen", "meaning": "pulpen", "kanji": ""},
-        "ポ": {"word": "ポケット", "reading": "poketto", "meaning": "saku", "kanji": ""}
-    }
-    default_example = {"word": "", "reading": "", "meaning": "", "kanji": ""}
-    return character_examples.get(character, default_example)
+    return _CHARACTER_EXAMPLES.get(character, _DEFAULT_EXAMPLE)
 
-def parse_arguments():
-    """コマンドライン引数をパースする"""
+def parse_arguments(argv: Optional[List[str]] = None):
+    """コマンドライン引数をパースする（argv を省略した場合は sys.argv を使う）"""
     parser = argparse.ArgumentParser(description='H5Pコンテンツを生成する')
-    parser.add_argument('--lesson_id', type=str, required=True,
+    parser.add_argument('--lesson_id', type=str,
                         help='レッスンID (例: hiragana, katakana)')
-    parser.add_argument('--content_type', type=str, required=True,
+    parser.add_argument('--content_type', type=str,
                         help='コンテンツタイプ (例: dialog_cards, course_presentation)')
-    parser.add_argument('--task_file', type=str, required=True,
-                        help='タスク指示ファイルのパス')
-    parser.add_argument('--output_dir', type=str, required=True,
+    parser.add_argument('--content_types', type=str,
+                        help='複数のコンテンツタイプをカンマ区切りで指定し、並列に生成する'
+                             '（例: dialog_cards,course_presentation,multiple_choice,fill_blanks）')
+    parser.add_argument('--task_file', type=str,
+                        help='タスク指示ファイルのパス（ディレクトリ指定時は中の .md を全て処理）')
+    parser.add_argument('--output_dir', type=str,
                         help='出力ディレクトリ')
+    parser.add_argument('--manifest', type=str,
+                        help='ジョブ一覧のJSONファイル（指定時は上記4項目をジョブごとに記述）')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='GPT-4oへの同時リクエスト数の上限（デフォルト: 4）')
+    parser.add_argument('--batch', action='store_true',
+                        help='OpenAI Batch APIで一括送信する（最大24時間、料金半額）')
+    parser.add_argument('--multi_prompt', action='store_true',
+                        help='同じコンテンツタイプのジョブを1回のリクエストにまとめて生成する')
+    parser.add_argument('--compress', choices=['zstd'],
+                        help='出力JSONを圧縮して保存する（zstd: .json.zst）')
+    # worker.py からはキー名のまま --no_cache で渡されるので、そちらも受け付ける
+    parser.add_argument('--no-cache', '--no_cache', dest='no_cache', action='store_true',
+                        help='応答キャッシュ（.cache/）を使わずに必ずAPIへリクエストする')
+    parser.add_argument('--semantic_cache', action='store_true',
+                        help='似たプロンプト（埋め込みの類似度0.95以上）の応答も再利用する')
     parser.add_argument('--test', action='store_true',
                         help='テストモード（数文字のみ処理）')
     parser.add_argument('--test_chars', type=str, default="あいうかきアイウ",
                         help='テストモードで処理する文字（デフォルト: あいうかきアイウ）')
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # --content_type / --content_types はどちらもコンテンツタイプのリストとして扱う
+    if args.content_types:
+        args.content_types = [t.strip() for t in args.content_types.split(',') if t.strip()]
+    else:
+        args.content_types = [args.content_type] if args.content_type else []
+    if not args.content_type and args.content_types:
+        args.content_type = args.content_types[0]
+
+    # マニフェストを使わない場合は従来通りの必須項目をチェック
+    if not args.manifest:
+        required = ['lesson_id', 'content_type', 'output_dir']
+        if not args.test:
+            required.append('task_file')
+        missing = [name for name in required if not getattr(args, name)]
+        if args.task_file and os.path.isdir(args.task_file) and 'lesson_id' in missing:
+            missing.remove('lesson_id')
+        if missing:
+            parser.error(f"次の引数が必要です: {', '.join('--' + name for name in missing)}")
+    return args
+
+def build_jobs(args) -> List[Dict[str, str]]:
+    """引数から (lesson_id, content_type, task_file, output_dir) のジョブ一覧を組み立てる"""
+    if args.manifest:
+        with open(args.manifest, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        jobs = []
+        for entry in entries:
+            job = {
+                "lesson_id": entry.get("lesson_id", args.lesson_id),
+                "content_type": entry.get("content_type", args.content_type),
+                "task_file": entry.get("task_file", args.task_file),
+                "output_dir": entry.get("output_dir", args.output_dir),
+            }
+            missing = [key for key, value in job.items() if not value]
+            if missing:
+                raise ValueError(f"マニフェストのジョブに必要な項目がありません: {missing} ({entry})")
+            job["compress"] = entry.get("compress", args.compress)
+            jobs.append(job)
+        return jobs
+
+    # 同じレッスンの各コンテンツタイプを別ジョブにして並列に処理する
+    if os.path.isdir(args.task_file):
+        task_paths = sorted(Path(args.task_file).glob('*.md'))
+        lessons = [(path.stem, str(path), os.path.join(args.output_dir, path.stem)) for path in task_paths]
+    else:
+        lessons = [(args.lesson_id, args.task_file, args.output_dir)]
+
+    return [
+        {
+            "lesson_id": lesson_id,
+            "content_type": content_type,
+            "task_file": task_file,
+            "output_dir": output_dir,
+            "compress": args.compress,
+        }
+        for lesson_id, task_file, output_dir in lessons
+        for content_type in args.content_types
+    ]
+
+@lru_cache(maxsize=128)
+def _read_task_file_cached(file_path: str, mtime_ns: int, size: int) -> str:
+    """更新日時とサイズをキーにしてタスク指示ファイルの内容をキャッシュする"""
+    return Path(file_path).read_text(encoding='utf-8')
 
 def read_task_file(file_path: str) -> str:
-    """タスク指示ファイルを読み込む"""
+    """タスク指示ファイルを読み込む（変更がなければメモリ上のキャッシュを返す）"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+        st = os.stat(file_path)
+        return _read_task_file_cached(file_path, st.st_mtime_ns, st.st_size)
     except Exception as e:
         logger.error(f"タスクファイルの読み込みエラー: {e}")
         raise
 
+# コンテンツタイプごとに、JSON構造例が持っているはずの最上位キー
+_STRUCTURE_KEYS = {
+    "dialog_cards": "cards",
+    "course_presentation": "slides",
+    "multiple_choice": "questions",
+    "fill_blanks": "questions",
+}
+
 def extract_json_structure(task_content: str, content_type: str) -> Optional[Dict]:
     """タスク指示からJSONの構造を抽出する (未使用)"""
-    pattern = r"```json\s*([\s\S]*?)\s*```"
-    matches = re.findall(pattern, task_content)
-    for match in matches:
+    key = _STRUCTURE_KEYS.get(content_type)
+    if key is None:
+        return None
+    quoted_key = f'"{key}"'
+    for match in _JSON_BLOCK_RE.findall(task_content):
+        # キー名を含まないブロックはパースせずに読み飛ばす
+        if quoted_key not in match:
+            continue
         try:
-            json_obj = json.loads(match)
-            if (content_type == "dialog_cards" and "cards" in json_obj) or \
-               (content_type == "course_presentation" and "slides" in json_obj) or \
-               (content_type == "multiple_choice" and "questions" in json_obj) or \
-               (content_type == "fill_blanks" and "questions" in json_obj):
-                return json_obj
-        except json.JSONDecodeError:
+            json_obj = load_json(match)
+        except ValueError:
             continue
+        if isinstance(json_obj, dict) and key in json_obj:
+            return json_obj
     return None
 
-def generate_prompt(task_content: str, content_type: str, lesson_id: str) -> str:
-    """GPT-4oへのプロンプトを生成する"""
-    prompt = f"""
-あなたはH5Pコンテンツ作成の専門家です。以下のタスク指示に基づいて、{content_type}形式のJSONコンテンツを生成してください。
-レッスンID: {lesson_id}
+# GPT-4oへのシステムメッセージ。
+# 毎回まったく同じ文字列を先頭に置くことで、OpenAIの自動プロンプトキャッシュが効くようにする。
+# lesson_id・content_type・タスク指示など呼び出しごとに変わる内容は、必ず後ろのユーザーメッセージに入れること。
+SYSTEM_STATIC = """あなたはH5Pインタラクティブコンテンツ作成の専門家であり、日本語教育の経験が豊富な教材開発者です。
+ユーザーから渡されるタスク指示に従って、H5P教材用のJSONコンテンツを生成してください。
+
+【対象学習者】
+- 日本語能力試験N5レベルを目指すインドネシア人学習者
+- このコンテンツは日本語学習のためのものです。インドネシア人学習者向けに調整してください。
+- 説明・訳語・ヒントはインドネシア語で書き、日本語の例文はN5の語彙・文法の範囲に収める
+- ひらがな・カタカナの学習段階では、漢字を使う場合は必ず読み仮名を添える
+- 文化的に分かりにくい語は、インドネシアの身近なものに置き換えて説明する
+
+【出力ルール】
+- JSONだけを返してください。説明やコメント、Markdownのコードブロックは不要です。
+- content_type に応じた最上位キーを使う
+  - dialog_cards: "cards"（各要素に "text", "answer", 必要なら "tip"）
+  - course_presentation: "slides"
+  - multiple_choice: "questions"（各問に "answers"）
+  - fill_blanks: "questions"（空欄は *答え* の形式）
+- タスク指示にJSONの構造例がある場合は、そのキー名と入れ子構造に従う
+- 文字列中のHTMLは、H5Pでそのまま表示できる簡単なタグ（<p>, <strong>, <br> など）だけを使う
+- タスク指示で指定された項目数・順序を守り、途中で省略しない
+
+【ユーザーメッセージの形式】
+- 1行目に lesson_id、2行目に content_type、空行のあとにタスク指示が続く
+"""
 
-{task_content}
+# 毎回同じシステムメッセージはモジュール読み込み時に1度だけ組み立てて使い回す（読み取り専用として扱う）
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_STATIC}
+_USER_MESSAGE_HEADER = "lesson_id={lesson_id}\ncontent_type={content_type}\n\n"
 
-このコンテンツは日本語学習のためのものです。インドネシア人学習者向けに調整してください。
-JSONだけを返してください。説明やコメントは不要です。
-"""
-    return prompt
+def build_user_messages(task_content: str, content_type: str, lesson_id: str) -> List[Dict[str, str]]:
+    """GPT-4oへのメッセージを生成する（固定のシステムメッセージ → 可変のユーザーメッセージの順）"""
+    header = _USER_MESSAGE_HEADER.format(lesson_id=lesson_id, content_type=content_type)
+    return [
+        _SYSTEM_MESSAGE,
+        {"role": "user", "content": header + task_content}
+    ]
 
-def call_gpt4o(prompt: str) -> str:
-    """GPT-4oにリクエストを送信して結果を取得する"""
-    max_retries = 3
-    retry_delay = 5
+def build_chat_request(messages: List[Dict[str, str]], max_tokens: int = 10000) -> Dict[str, Any]:
+    """
+    chat.completions に渡すリクエストボディを組み立てる（通常送信とBatch APIで共通）。
+    JSONモードを指定して、応答が必ずパース可能なJSONオブジェクトになるようにする。
+    """
+    return {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"}
+    }
+
+async def call_gpt4o(messages: List[Dict[str, str]], max_tokens: int = 10000,
+                     cache_scope: Optional[str] = None) -> str:
+    """
+    GPT-4oにリクエストを送信して結果を取得する。
+    まずリクエスト内容が完全一致するキャッシュを探し、
+    cache_scope（コンテンツタイプなど）を指定した場合は同じscopeの似たプロンプトの応答も探す。
+    """
+    request = build_chat_request(messages, max_tokens=max_tokens)
+    cached = exact_cache.get(request)
+    if cached is not None:
+        return cached
+
+    embedding = None
+    if cache_scope is not None:
+        scope = f"{request['model']}:{cache_scope}"
+        # システムメッセージは毎回同じなので、可変部分（ユーザーメッセージ）だけで類似度を測る
+        user_text = "\n".join(m["content"] for m in messages if m["role"] == "user")
+        cached, embedding = await semantic_cache.get(user_text, scope)
+        if cached is not None:
+            return cached
+
+    response = await request_gpt4o(messages, max_tokens)
+    # パースできない応答をキャッシュすると次回以降も同じ失敗を繰り返すので、確かめてから保存する
+    extract_json_from_response(response)
+    exact_cache.put(request, response)
+    if cache_scope is not None:
+        semantic_cache.add(embedding, response, scope)
+    return response
+
+class AdaptiveLimiter:
+    """
+    同時実行数の上限を実行中に変えられるリミッター（AIMD）。
+    失敗が続いたら上限を半分にし、成功するたびに1ずつ元の上限まで戻す。
+    """
+
+    def __init__(self, limit: int):
+        self.max_limit = max(1, limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def decrease(self):
+        self.limit = max(1, self.limit // 2)
+        logger.warning(f"同時リクエスト数の上限を {self.limit} に下げます")
+
+    def increase(self):
+        if self.limit < self.max_limit:
+            self.limit += 1
+
+
+class CircuitBreaker:
+    """
+    連続して失敗（429・5xx・接続エラー）が続いたら回路を開き、一定時間リクエストを止める。
+    開いている時間は 0.5秒 から倍々で最大60秒まで伸ばし、成功したら元に戻す。
+    開いている間の呼び出しは失敗させずに待たせ、時間が過ぎたら1件だけ試しに通して（HALF_OPEN）、
+    その結果が出るまで他の呼び出しは待たせる。
+    """
+
+    # HALF_OPEN で試しの1件の結果を待つ間隔（秒）
+    PROBE_WAIT_INTERVAL = 0.1
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, error_threshold: int = 5, reset_timeout: float = 0.5, max_reset_timeout: float = 60.0):
+        self.error_threshold = error_threshold
+        self.initial_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_errors = 0
+        self.reopen_at = 0.0
+        self.limiter: Optional[AdaptiveLimiter] = None
+
+    async def before_call(self) -> bool:
+        """
+        リクエストを送ってよくなるまで待つ。
+        HALF_OPEN の試しの1件として通した場合は True を返す（結果を record_* か release_probe で必ず返すこと）。
+        """
+        while self.state != self.CLOSED:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now >= self.reopen_at:
+                    self.state = self.HALF_OPEN
+                    return True
+                await asyncio.sleep(self.reopen_at - now)
+            else:
+                await asyncio.sleep(self.PROBE_WAIT_INTERVAL)
+        return False
+
+    def release_probe(self):
+        """試しの1件が 429・5xx 以外の理由で失敗した場合、次の呼び出しをすぐに試しの1件として通す"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.reopen_at = time.monotonic()
+
+    def record_success(self):
+        self.consecutive_errors = 0
+        if self.state != self.CLOSED:
+            logger.info("サーキットブレーカーを閉じます")
+            self.state = self.CLOSED
+            self.reset_timeout = self.initial_reset_timeout
+        if self.limiter:
+            self.limiter.increase()
+
+    def record_failure(self):
+        self.consecutive_errors += 1
+        if self.state == self.HALF_OPEN or self.consecutive_errors >= self.error_threshold:
+            self.state = self.OPEN
+            self.reopen_at = time.monotonic() + self.reset_timeout
+            logger.warning(f"サーキットブレーカーを開きます（{self.reset_timeout:.1f}秒）")
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            if self.limiter:
+                self.limiter.decrease()
+
+
+# GPT-4oへのリクエスト全体で共有するサーキットブレーカー
+gpt4o_breaker = CircuitBreaker()
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """429応答の Retry-After ヘッダ（秒）を取り出す。なければ None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+async def call_with_retries(request: Callable[[], Awaitable[Any]], token_estimate: int,
+                            label: str = "GPT-4o") -> Any:
+    """
+    OpenAI APIへのリクエストを、レート制限とサーキットブレーカーを通して送る。
+    429・5xx・接続エラー（ストリーム途中の切断を含む）のみ、full jitter付きの指数バックオフでリトライする。
+    400や認証エラーなど、何度送っても成功しないエラーはそのまま送出する。
+    再送のたびに新しいリクエストを作れるよう、コルーチンではなく関数を受け取る。
+    """
+    max_retries = 6
+    base_delay = 1
+    max_delay = 60
 
     for attempt in range(max_retries):
+        probe = await gpt4o_breaker.before_call()
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a H5P content creation expert."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=10000
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.warning(f"GPT-4oリクエスト失敗 (試行 {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2
-            else:
-                logger.error("GPT-4oリクエストの最大試行回数を超えました")
+            await gpt4o_rate_limiter.acquire(token_estimate)
+            result = await request()
+            gpt4o_breaker.record_success()
+            return result
+        except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError,
+                httpx.TransportError) as e:
+            gpt4o_breaker.record_failure()
+            logger.warning(f"{label}リクエスト失敗 (試行 {attempt + 1}/{max_retries}): {e}")
+            if attempt == max_retries - 1:
+                logger.error(f"{label}リクエストの最大試行回数を超えました")
                 raise
+            delay = get_retry_after(e) if isinstance(e, RateLimitError) else None
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            await asyncio.sleep(delay)
+        except BaseException:
+            # 400 やJSONでない応答などは回路の状態とは関係ないので、試しの1件の枠だけ返す
+            if probe:
+                gpt4o_breaker.release_probe()
+            raise
+
+async def request_gpt4o(messages: List[Dict[str, str]], max_tokens: int = 10000) -> str:
+    """
+    GPT-4oに実際にリクエストを送信する（リトライは call_with_retries で行う）。
+    応答はストリーミングで受け取り、先頭がJSONオブジェクトでなければその時点で打ち切る。
+    """
+    async def stream_once() -> str:
+        stream = await async_client.chat.completions.create(
+            **build_chat_request(messages, max_tokens=max_tokens),
+            stream=True
+        )
+        parts = []
+        started = False
+        finish_reason = None
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta.content or ""
+            if not started and delta.strip():
+                started = True
+                if not delta.lstrip().startswith("{"):
+                    await stream.close()
+                    raise ValueError(f"GPT-4oの応答がJSONオブジェクトで始まっていません: {delta[:50]!r}")
+            parts.append(delta)
+            finish_reason = choice.finish_reason or finish_reason
+        if finish_reason == "length":
+            # 途中で切れたJSONは使えない（同じ max_tokens で送り直しても同じなのでリトライしない）
+            raise ValueError(f"GPT-4oの応答が max_tokens={max_tokens} で打ち切られました")
+        return "".join(parts)
+
+    return await call_with_retries(stream_once, estimate_request_tokens(messages, max_tokens))
+
+async def call_gpt4o_multi(prompts: List[Dict[str, Any]]) -> List[str]:
+    """
+    複数のジョブのメッセージ ({"id": ..., "messages": [...]}) を1回のリクエストで生成し、
+    入力と同じ順序で各結果のJSON文字列を返す。
+    まとめるとコンテキスト長や出力上限を超える場合は、1件ずつのリクエストに切り替える。
+    """
+    if len(prompts) == 1:
+        return [await call_gpt4o(prompts[0]["messages"])]
+
+    max_tokens = MULTI_PROMPT_TOKENS_PER_RESULT * len(prompts)
+    # 日本語はおおよそ1文字1トークンとして見積もる
+    user_contents = [p["messages"][-1]["content"] for p in prompts]
+    estimated_input_tokens = len(SYSTEM_STATIC) + sum(len(content) for content in user_contents)
+    if max_tokens > MODEL_MAX_OUTPUT_TOKENS or estimated_input_tokens + max_tokens > MODEL_CONTEXT_TOKENS:
+        logger.info(f"{len(prompts)}件をまとめるとトークン上限を超えるため、個別にリクエストします")
+        return list(await asyncio.gather(*(call_gpt4o(p["messages"]) for p in prompts)))
+
+    sections = [f"### id: {p['id']}\n{content}" for p, content in zip(prompts, user_contents)]
+    combined_user_content = (
+        "以下の複数のタスクについて、それぞれの出力を生成してください。\n"
+        '結果は {"results": [{"id": <タスクのid>, "content": {<そのタスクのJSON>}}]} の形式のJSONだけで返してください。\n\n'
+        + "\n\n".join(sections)
+    )
+    response = await call_gpt4o(
+        [_SYSTEM_MESSAGE, {"role": "user", "content": combined_user_content}],
+        max_tokens=max_tokens
+    )
+    results = {
+        str(item.get("id")): item.get("content")
+        for item in extract_json_from_response(response).get("results", [])
+    }
 
-def extract_json_from_response(response: str) -> Dict:
-    """GPT-4oのレスポンスからJSONを抽出する"""
-    json_pattern = r"```json\s*([\s\S]*?)\s*```"
-    json_match = re.search(json_pattern, response)
-    if json_match:
-        json_str = json_match.group(1)
-    else:
-        json_str = response.strip()
+    outputs = []
+    for p in prompts:
+        content = results.get(str(p["id"]))
+        if content is None:
+            # まとめた応答に含まれなかったタスクだけ個別に再生成する
+            logger.warning(f"まとめたリクエストの結果にid={p['id']}が含まれていないため、個別にリクエストします")
+            outputs.append(await call_gpt4o(p["messages"]))
+        else:
+            outputs.append(json.dumps(content, ensure_ascii=False))
+    return outputs
 
+async def submit_batch(prompts: List[Tuple[str, str, List[Dict[str, str]]]]) -> Dict[str, str]:
+    """
+    (lesson_id, content_type, messages) のリストをBatch APIで送信し、
+    完了後に custom_id ("{lesson_id}_{content_type}") → 応答テキスト の辞書を返す。
+    """
+    lines = []
+    for lesson_id, content_type, messages in prompts:
+        lines.append(json.dumps({
+            "custom_id": f"{lesson_id}_{content_type}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_chat_request(messages)
+        }, ensure_ascii=False))
+    batch_input = ("\n".join(lines) + "\n").encode("utf-8")
+
+    input_file = await async_client.files.create(
+        file=("batch_input.jsonl", batch_input),
+        purpose="batch"
+    )
+    batch = await async_client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logger.info(f"Batchジョブを送信しました: {batch.id} ({len(prompts)}件)")
+
+    # 完了までポーリング（間隔は指数的に伸ばし、最大5分）
+    poll_interval = 10
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, 300)
+        batch = await async_client.batches.retrieve(batch.id)
+        logger.info(f"Batchジョブ状態: {batch.status} ({batch.request_counts})")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batchジョブが完了しませんでした: {batch.id} status={batch.status}")
+
+    output = await async_client.files.content(batch.output_file_id)
+    responses = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        custom_id = item.get("custom_id")
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            logger.error(f"Batchリクエスト失敗 ({custom_id}): {item.get('error') or response}")
+            continue
+        responses[custom_id] = response["body"]["choices"][0]["message"]["content"]
+    return responses
+
+def extract_json_from_response(response: str) -> Dict:
+    """GPT-4oのレスポンス（JSONモードのためJSONそのもの）をパースする"""
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
+        return load_json(response)
+    except ValueError as e:
         logger.error(f"JSONのパースエラー: {e}")
-        logger.debug(f"解析しようとしたJSON文字列: {json_str}")
+        logger.debug(f"解析しようとしたJSON文字列: {response}")
         raise
 
 def generate_title_and_description_from_task(task):
@@ -877,12 +1392,16 @@ def generate_title_and_description_from_task(task):
 
     return title, description
 
-def generate_media_batch(characters: List[str], output_dir: str) -> Dict[str, Dict[str, Optional[str]]]:
+async def generate_media_batch(characters: List[str], output_dir: str,
+                               media_cache: MediaCache) -> Dict[str, Dict[str, Optional[str]]]:
     """
-    複数の文字の画像と音声ファイルをバッチ生成する。
+    複数の文字の画像と音声ファイルをまとめて生成する。
     - generate_example_image のみを使って文字画像を生成する。
     - example_imagesフォルダは作らず、すべてimagesフォルダに保存する。
     - 例単語用の画像 (ex_...) は生成しない。
+    - 文字ごとの画像・音声リクエストは、MEDIA_CONCURRENCY 文字分まで同時に実行する。
+    - 生成条件が前回と同じ画像・音声は media_cache から配置し、APIを呼ばない。
+    - 画像の縮小やファイルのコピーなど、ブロックする処理はスレッドに逃がしてイベントループを止めない。
     """
     images_dir = os.path.join(output_dir, 'images')
     audio_dir = os.path.join(output_dir, 'audios')
@@ -890,7 +1409,6 @@ def generate_media_batch(characters: List[str], output_dir: str) -> Dict[str, Di
     os.makedirs(audio_dir, exist_ok=True)
 
     results = {}
-    batch_size = 5
 
     # 進捗管理ファイル
     progress_file = os.path.join(output_dir, '.media_progress.json')
@@ -907,93 +1425,215 @@ def generate_media_batch(characters: List[str], output_dir: str) -> Dict[str, Di
     characters_to_process = [c for c in characters if c not in processed_chars]
     logger.info(f"処理対象: {len(characters_to_process)}文字 / 全{len(characters)}文字")
 
-    for i in range(0, len(characters_to_process), batch_size):
-        batch = characters_to_process[i:i + batch_size]
-        logger.info(
-            f"バッチ {i // batch_size + 1} / {(len(characters_to_process) + batch_size - 1) // batch_size} : {batch}"
-        )
-
-        for char in batch:
-            char_result = {}
-            try:
-                # 文字タイプ
-                is_katakana = (ord(char) >= ord('ア') and ord(char) <= ord('ン'))
-                char_type = 'katakana' if is_katakana else 'hiragana'
-
-                # ファイルパス定義（例単語用のex_... は作らない）
-                char_img_name = f"char_{char_type}_{char}.png"
-                char_img_path = os.path.join(images_dir, char_img_name)
-
-                audio_name = f"{char_type}_{char}.mp3"
-                audio_path = os.path.join(audio_dir, audio_name)
-                example_info = get_example_word_and_translation(char)
-                word = example_info.get('word', '')
-                example_reading = example_info.get('reading', '')
-                example_meaning = example_info.get('meaning', '')
-                kanji = example_info.get('kanji', '')
-                kanji_meaning_in_English = example_info.get('kanji_meaning_in_English', '')
-                visual_cues = example_info.get('visual_cues', '')
-
-                # --- 文字画像の生成 ---
-                if not os.path.exists(char_img_path):
-                    logger.info(f"{char} の文字画像(generate_example_image)生成...")
-                    success = generate_example_image(
-                        word=char,                # word はあえて文字を使う
-                        character=char,
-                        character_type=char_type,
-                        kanji=kanji,
-                        visual_cues=visual_cues,
-                        kanji_meaning_in_English=kanji_meaning_in_English,
-                        output_path=char_img_path,
-                        provider="openai"      # 必要に応じて "openai" に変更
-                    )
-                    if success:
-                        char_result['char_image'] = f"images/{char_img_name}"
-                    else:
-                        char_result['char_image'] = None
-                else:
+    semaphore = asyncio.Semaphore(MEDIA_CONCURRENCY)
+
+    async def process_char(char: str) -> Dict[str, Optional[str]]:
+        char_result = {}
+        async with semaphore:
+            # 文字タイプ
+            char_type = 'katakana' if is_katakana(char) else 'hiragana'
+
+            # ファイルパス定義（例単語用のex_... は作らない）
+            char_img_name = f"char_{char_type}_{char}.png"
+            char_img_path = os.path.join(images_dir, char_img_name)
+
+            audio_name = f"{char_type}_{char}.mp3"
+            audio_path = os.path.join(audio_dir, audio_name)
+            example_info = get_example_word_and_translation(char)
+            kanji = example_info.get('kanji', '')
+            kanji_meaning_in_English = example_info.get('kanji_meaning_in_English', '')
+            visual_cues = example_info.get('visual_cues', '')
+            provider = "openai"      # 必要に応じて "stability" に変更
+
+            async def make_image() -> Optional[str]:
+                prompt = build_image_prompt(char, kanji, kanji_meaning_in_English, visual_cues)
+                key = media_cache.cache_key(provider, IMAGE_MODEL, IMAGE_SIZE, prompt)
+                if await asyncio.to_thread(media_cache.restore, char_img_name, key, char_img_path):
                     logger.info(f"文字画像が既に存在: {char_img_path}")
-                    char_result['char_image'] = f"images/{char_img_name}"
-
-                # --- 音声の生成 ---
-                if not os.path.exists(audio_path):
-                    logger.info(f"{char} の音声ファイルを生成...")
-                    success = generate_audio(char, audio_path, include_example=True)
-                    if success:
-                        char_result['audio'] = f"audios/{audio_name}"
-                    else:
-                        char_result['audio'] = None
-                else:
+                    return f"images/{char_img_name}"
+                logger.info(f"{char} の文字画像(generate_example_image)生成...")
+                success = await generate_example_image(
+                    word=char,                # word はあえて文字を使う
+                    character=char,
+                    character_type=char_type,
+                    kanji=kanji,
+                    visual_cues=visual_cues,
+                    kanji_meaning_in_English=kanji_meaning_in_English,
+                    output_path=char_img_path,
+                    provider=provider
+                )
+                if not success:
+                    return None
+                await asyncio.to_thread(media_cache.store, char_img_name, key, char_img_path)
+                return f"images/{char_img_name}"
+
+            async def make_audio() -> Optional[str]:
+                key = media_cache.cache_key(TTS_MODEL, TTS_VOICE, f"{char}。。。{example_info.get('word', '')}")
+                if await asyncio.to_thread(media_cache.restore, audio_name, key, audio_path):
                     logger.info(f"音声ファイル既存: {audio_path}")
-                    char_result['audio'] = f"audio/{audio_name}"
+                    return f"audios/{audio_name}"
+                logger.info(f"{char} の音声ファイルを生成...")
+                success = await generate_audio(char, audio_path, include_example=True,
+                                               example_word=example_info.get('word', ''))
+                if not success:
+                    return None
+                await asyncio.to_thread(media_cache.store, audio_name, key, audio_path)
+                return f"audios/{audio_name}"
+
+            # 画像と音声は互いに独立しているので同時に生成する
+            char_result['char_image'], char_result['audio'] = await asyncio.gather(make_image(), make_audio())
+
+        # 例単語用の画像は作らないので、'example_image' は作らない
+        # char_result['example_image'] = None  # 必要なら明示的にNoneを入れてもよい
+
+        # 結果保存（進捗ファイルは PROGRESS_SAVE_INTERVAL 文字ごとに更新）
+        nonlocal unsaved
+        processed_chars[char] = char_result
+        unsaved += 1
+        if unsaved >= PROGRESS_SAVE_INTERVAL:
+            save_progress()
+        return char_result
+
+    def save_progress():
+        """途中で落ちても壊れた進捗ファイルが残らないよう、一時ファイルに書いてから置き換える"""
+        nonlocal unsaved
+        tmp_path = progress_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(dump_json_bytes(processed_chars, indent=False))
+        os.replace(tmp_path, progress_file)
+        unsaved = 0
+
+    unsaved = 0
+    outcomes = await asyncio.gather(
+        *(process_char(char) for char in characters_to_process),
+        return_exceptions=True
+    )
+    if unsaved:
+        save_progress()
+    media_cache.save()
+
+    for char, outcome in zip(characters_to_process, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"{char} メディア生成エラー: {outcome}")
+            results[char] = {
+                'char_image': None,
+                'audio': None
+            }
+        else:
+            results[char] = outcome
 
-                # 例単語用の画像は作らないので、'example_image' は作らない
-                # char_result['example_image'] = None  # 必要なら明示的にNoneを入れてもよい
+    return results
 
-                # 結果保存
-                results[char] = char_result
-                processed_chars[char] = char_result
+async def validate_model():
+    """モデル名を起動時に1回だけ確認し、存在しなければリトライせずに終了する"""
+    try:
+        await async_client.models.retrieve(MODEL)
+    except Exception as e:
+        logger.error(f"モデル {MODEL} を利用できません（環境変数 OPENAI_MODEL を確認してください）: {e}")
+        sys.exit(2)
 
-                # 進捗ファイル更新
-                with open(progress_file, 'w', encoding='utf-8') as f:
-                    json.dump(processed_chars, f, ensure_ascii=False, indent=2)
+async def finalize_job(job: Dict[str, str], response: str) -> str:
+    """GPT-4oの応答からJSONを取り出して保存する"""
+    content_json = extract_json_from_response(response)
 
-            except Exception as e:
-                logger.error(f"{char} メディア生成エラー: {e}")
-                results[char] = {
-                    'char_image': None,
-                    'audio': None
-                }
+    # title/description を task から補完
+    if job["content_type"] == "dialog_cards":
+        title, description = generate_title_and_description_from_task(content_json)
+        content_json["title"] = title
+        content_json["description"] = description
 
-        if i + batch_size < len(characters_to_process):
-            logger.info("バッチ完了。少し待機して次のバッチへ...")
-            time.sleep(2)
+    output_path = await save_json_content(
+        content_json,
+        job["output_dir"],
+        job["lesson_id"],
+        job["content_type"],
+        job.get("compress")
+    )
 
+    logger.info(f"H5Pコンテンツ生成完了: {output_path}")
+    return output_path
+
+async def process_one(job: Dict[str, str], limiter: AdaptiveLimiter) -> str:
+    """1ジョブ分（タスク読み込み→GPT-4o→JSON保存）を処理する"""
+    task_content = read_task_file(job["task_file"])
+    messages = build_user_messages(task_content, job["content_type"], job["lesson_id"])
+
+    # 同時に飛ばすリクエスト数はリミッターで制限する
+    async with limiter:
+        logger.info(f"GPT-4oにリクエスト送信中... ({job['lesson_id']} / {job['content_type']})")
+        response = await call_gpt4o(messages, cache_scope=job["content_type"])
+
+    return await finalize_job(job, response)
+
+async def run_multi_prompt(jobs: List[Dict[str, str]], limiter: AdaptiveLimiter) -> List[Any]:
+    """同じコンテンツタイプのジョブを数件ずつ1回のリクエストにまとめて処理する"""
+    per_request = max(1, MODEL_MAX_OUTPUT_TOKENS // MULTI_PROMPT_TOKENS_PER_RESULT)
+    groups: Dict[str, List[int]] = {}
+    for index, job in enumerate(jobs):
+        groups.setdefault(job["content_type"], []).append(index)
+
+    results: List[Any] = [None] * len(jobs)
+
+    async def process_chunk(indices: List[int]):
+        prompts = []
+        for index in indices:
+            job = jobs[index]
+            task_content = read_task_file(job["task_file"])
+            prompts.append({
+                "id": str(index),
+                "messages": build_user_messages(task_content, job["content_type"], job["lesson_id"])
+            })
+        try:
+            async with limiter:
+                logger.info(f"GPT-4oに{len(prompts)}件をまとめてリクエスト送信中...")
+                responses = await call_gpt4o_multi(prompts)
+        except Exception as e:
+            for index in indices:
+                results[index] = e
+            return
+        outputs = await asyncio.gather(
+            *(finalize_job(jobs[index], response) for index, response in zip(indices, responses)),
+            return_exceptions=True
+        )
+        for index, output in zip(indices, outputs):
+            results[index] = output
+
+    chunks = [
+        indices[i:i + per_request]
+        for indices in groups.values()
+        for i in range(0, len(indices), per_request)
+    ]
+    await asyncio.gather(*(process_chunk(chunk) for chunk in chunks))
     return results
 
-def main():
-    """メイン実行関数"""
-    args = parse_arguments()
+async def run_batch(jobs: List[Dict[str, str]]) -> List[Any]:
+    """全ジョブのプロンプトをBatch APIでまとめて処理する"""
+    jobs_by_id = {}
+    prompts = []
+    for job in jobs:
+        custom_id = f"{job['lesson_id']}_{job['content_type']}"
+        if custom_id in jobs_by_id:
+            raise ValueError(f"Batchモードでは lesson_id と content_type の組み合わせが重複できません: {custom_id}")
+        jobs_by_id[custom_id] = job
+        task_content = read_task_file(job["task_file"])
+        prompts.append((job["lesson_id"], job["content_type"],
+                        build_user_messages(task_content, job["content_type"], job["lesson_id"])))
+
+    responses = await submit_batch(prompts)
+
+    async def dispatch(custom_id: str, job: Dict[str, str]) -> str:
+        if custom_id not in responses:
+            raise RuntimeError(f"Batchの結果がありません: {custom_id}")
+        return await finalize_job(job, responses[custom_id])
+
+    return await asyncio.gather(
+        *(dispatch(custom_id, job) for custom_id, job in jobs_by_id.items()),
+        return_exceptions=True
+    )
+
+async def main(argv: Optional[List[str]] = None):
+    """メイン実行関数（worker.py からは argv を渡して呼ばれる）"""
+    args = parse_arguments(argv)
 
     # テストモード
     if args.test:
@@ -1012,38 +1652,48 @@ def main():
             }
             content["cards"].append(card)
 
-        output_path = save_json_content(
+        output_path = await save_json_content(
             content,
             args.output_dir,
             args.lesson_id,
-            args.content_type
+            args.content_type,
+            args.compress
         )
         logger.info(f"テスト用コンテンツ生成完了: {output_path}")
         return
 
     # 通常モード
-    task_content = read_task_file(args.task_file)
-    prompt = generate_prompt(task_content, args.content_type, args.lesson_id)
-
-    logger.info(f"GPT-4oにリクエスト送信中...")
-    response = call_gpt4o(prompt)
-
-    content_json = extract_json_from_response(response)
-
-    # title/description を task から補完
-    if args.content_type == "dialog_cards":
-        title, description = generate_title_and_description_from_task(content_json)
-        content_json["title"] = title
-        content_json["description"] = description
-
-    output_path = save_json_content(
-        content_json,
-        args.output_dir,
-        args.lesson_id,
-        args.content_type
-    )
+    # worker.py では main() が同じプロセスで繰り返し呼ばれるので、前回の指定を引き継がないよう毎回設定する
+    exact_cache.enabled = not args.no_cache
+    # 類似度だけで引くので、別のレッスンの似たプロンプトにもヒットしうる。指定したときだけ使う
+    semantic_cache.enabled = args.semantic_cache and not args.no_cache
+
+    await validate_model()
+    jobs = build_jobs(args)
+    if args.batch:
+        logger.info(f"{len(jobs)}件のジョブをBatch APIで処理します")
+        results = await run_batch(jobs)
+    elif args.multi_prompt:
+        logger.info(f"{len(jobs)}件のジョブをコンテンツタイプごとにまとめて処理します")
+        limiter = AdaptiveLimiter(args.concurrency)
+        gpt4o_breaker.limiter = limiter
+        results = await run_multi_prompt(jobs, limiter)
+    else:
+        logger.info(f"{len(jobs)}件のジョブを最大{args.concurrency}並列で処理します")
+        limiter = AdaptiveLimiter(args.concurrency)
+        gpt4o_breaker.limiter = limiter
+        results = await asyncio.gather(
+            *(process_one(job, limiter) for job in jobs),
+            return_exceptions=True
+        )
 
-    logger.info(f"H5Pコンテンツ生成完了: {output_path}")
+    failed = 0
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            failed += 1
+            logger.error(f"ジョブ失敗 ({job['lesson_id']} / {job['content_type']}): {result}")
+    if failed:
+        raise SystemExit(f"{failed}/{len(jobs)}件のジョブが失敗しました")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
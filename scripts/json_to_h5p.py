@@ -5,19 +5,25 @@ JSONからH5Pパッケージを生成するスクリプト
 """
 
 import os
+import re
 import json
 import argparse
+import hashlib
 import logging
-import shutil
-import tempfile
 import zipfile
 from pathlib import Path
-import re
-import glob
 import uuid
 import subprocess
-import cairosvg
+import tempfile
 from datetime import datetime
+from io import BytesIO
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json で代用する
+    orjson = None
+from functools import lru_cache, partial
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,176 +38,469 @@ CONTENT_TYPE_MAPPING = {
     "memory_game": "H5P.MemoryGame"
 }
 
+# ファイル名に含まれるコンテンツタイプを1回の検索で見つける
+_TYPE_RE = re.compile('|'.join(re.escape(key) for key in CONTENT_TYPE_MAPPING))
+
+# 中身から判定するとき、先頭だけ読んでキーを探す（決まらなければ全体をパースする）
+_SNIFF_BYTES = 4096
+_SNIFF_KEYS = (
+    (b'"cards"', 'dialog_cards'),
+    (b'"dialogs"', 'dialog_cards'),
+    (b'"slides"', 'course_presentation'),
+)
+
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_dir', required=True)
     parser.add_argument('--output_dir', required=True)
     parser.add_argument('--templates_dir', default='src/templates')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='並列数（省略時はスレッドなら CPU数×4（最大32）、プロセスなら CPU数）')
+    parser.add_argument('--processes', action='store_true',
+                        help='スレッドではなくプロセスで並列化する（大きなテンプレートで圧縮がCPU律速になる場合）')
+    parser.add_argument('--force', action='store_true',
+                        help='入力に変更がないパッケージも作り直す')
     return parser.parse_args()
 
+JSON_SUFFIXES = ('.json', '.json.zst')
+
+# すでに圧縮済みの形式はDEFLATEしても縮まないので、H5Pには無圧縮で格納する
+STORED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.m4a', '.ogg', '.mp4', '.webm', '.woff', '.woff2')
+
+# バイト列のまま読み込む（orjson がなければ標準の json。どちらもUTF-8のバイト列を受け付ける）
+_load_json = orjson.loads if orjson is not None else json.loads
+
+def _dump_json_bytes(obj, compact=False):
+    """
+    UTF-8 JSONにする（orjson があればCで高速に）。
+    H5Pパッケージ内のJSONは人が読まないので compact=True で詰めて書く。
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (0 if compact else orjson.OPT_INDENT_2)
+        return orjson.dumps(obj, option=option)
+    if compact:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
 def find_json_files(input_dir):
-    result = []
-    for f in os.listdir(input_dir):
-        if f.endswith('.json') and not f.startswith('.'):  # ← ドットファイルをスキップ
-            result.append(os.path.join(input_dir, f))
-    return result
+    # ドットファイルはスキップ
+    return [e.path for e in os.scandir(input_dir)
+            if e.is_file() and e.name.endswith(JSON_SUFFIXES) and not e.name.startswith('.')]
+
+def load_json_file(json_file):
+    """JSONを読み込む（generate_content.py --compress zstd の .json.zst にも対応）"""
+    if json_file.endswith('.zst'):
+        import zstandard  # 圧縮ファイルを扱うときだけ必要
+        with open(json_file, 'rb') as f:
+            return _load_json(zstandard.ZstdDecompressor().decompress(f.read()))
+    with open(json_file, 'rb') as f:
+        return _load_json(f.read())
+
+def json_file_stem(json_file):
+    """拡張子（.json / .json.zst）を除いたファイル名"""
+    name = os.path.basename(json_file)
+    for suffix in JSON_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return Path(json_file).stem
+
 def determine_content_type(json_file):
-    base = os.path.basename(json_file)
-    for key in CONTENT_TYPE_MAPPING:
-        if key in base:
-            return key
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        if 'cards' in data or 'dialogs' in data:
-            return 'dialog_cards'
-        elif 'slides' in data:
-            return 'course_presentation'
-        elif 'questions' in data:
-            if any('answers' in q for q in data['questions']):
-                return 'multiple_choice'
-            if any('*' in q.get('text', '') for q in data['questions']):
-                return 'fill_blanks'
+    # 同じファイルを何度判定しても読み直さない（更新されたら mtime が変わるので判定し直す）
+    return _determine_content_type_cached(json_file, os.stat(json_file).st_mtime_ns)
+
+@lru_cache(maxsize=None)
+def _determine_content_type_cached(json_file, mtime_ns):
+    # generate_content.py は N5_{lesson_id}_{content_type}.json で保存するので、最後に現れたものを使う
+    matches = _TYPE_RE.findall(os.path.basename(json_file))
+    if matches:
+        return matches[-1]
+    if not json_file.endswith('.zst'):
+        with open(json_file, 'rb') as f:
+            head = f.read(_SNIFF_BYTES)
+        found = {content_type for marker, content_type in _SNIFF_KEYS if marker in head}
+        if len(found) == 1 and b'"questions"' not in head:
+            return found.pop()
+    data = load_json_file(json_file)
+    if 'cards' in data or 'dialogs' in data:
+        return 'dialog_cards'
+    elif 'slides' in data:
+        return 'course_presentation'
+    elif 'questions' in data:
+        if any('answers' in q for q in data['questions']):
+            return 'multiple_choice'
+        if any('*' in q.get('text', '') for q in data['questions']):
+            return 'fill_blanks'
     return 'dialog_cards'
 
+@lru_cache(maxsize=None)
+def list_templates_h5p(templates_dir):
+    """templates_dir 以下のH5Pテンプレートを一覧にする（順序はパス順で固定。run() のたびに探し直す）"""
+    return tuple(sorted(str(p) for p in Path(templates_dir).rglob('*.h5p')))
+
+@lru_cache(maxsize=None)
 def find_template_h5p(content_type, templates_dir):
-    pattern = os.path.join(templates_dir, content_type, '*.h5p')
-    matches = glob.glob(pattern)
-    if matches:
-        return matches[0]
-    all_templates = glob.glob(os.path.join(templates_dir, '**', '*.h5p'), recursive=True)
+    # templates_dir/<content_type>/ 直下のテンプレートを優先し、なければ最初に見つかったものを使う
+    all_templates = list_templates_h5p(templates_dir)
+    # rglob のパスは "./" などが正規化されているので、文字列ではなく Path 同士で比べる
+    type_dir = Path(templates_dir, content_type)
+    for template in all_templates:
+        if Path(template).parent == type_dir:
+            return template
     return all_templates[0] if all_templates else None
 
+# テンプレートの全エントリ（ZipInfo と中身のバイト列）をメモリに読み込んだもの
+# 各テンプレートにつき1回だけ読む（run_all.py のように長く動く場合に備え、更新されたら読み直す）
+_TEMPLATE_ENTRIES = {}  # テンプレートのハッシュ → エントリのリスト
+_TEMPLATE_HASHES = {}  # (パス, mtime) → テンプレートのハッシュ
+_TEMPLATE_ENTRIES_LOCK = threading.Lock()
+
+def load_template_entries(template):
+    """
+    テンプレートの (ZipInfo, bytes) のリストを返す（ZipInfo・bytes とも読み取り専用として扱う）。
+    中身が同じテンプレートは、パスが違っても（コンテンツタイプごとにコピーされていても）同じリストを共有する。
+    """
+    mtime_ns = os.stat(template).st_mtime_ns
+    with _TEMPLATE_ENTRIES_LOCK:
+        digest = _TEMPLATE_HASHES.get((template, mtime_ns))
+        if digest is None:
+            with open(template, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+            _TEMPLATE_HASHES[(template, mtime_ns)] = digest
+            if digest not in _TEMPLATE_ENTRIES:
+                with zipfile.ZipFile(BytesIO(raw), 'r') as zin:
+                    entries = [(info, zin.read(info)) for info in zin.infolist() if not info.is_dir()]
+                _TEMPLATE_ENTRIES[digest] = entries
+        return _TEMPLATE_ENTRIES[digest]
+
 def get_random_uuid():
     return str(uuid.uuid4())
 
+def _svg_to_png(svg_path):
+    """SVGを同じ名前のPNGに変換して元のSVGを消す。(svg, png, エラー) を返す"""
+    import cairosvg  # Cairoの読み込みは重いので、SVGがあるときだけ読み込む
+    png_path = svg_path[:-len(".svg")] + ".png"
+    try:
+        cairosvg.svg2png(url=svg_path, write_to=png_path)
+        os.remove(svg_path)
+        return svg_path, png_path, None
+    except Exception as e:
+        return svg_path, png_path, e
+
 def convert_svg_to_png_in_dir(images_dir):
-    for filename in os.listdir(images_dir):
-        if filename.endswith(".svg"):
-            svg_path = os.path.join(images_dir, filename)
-            png_path = os.path.join(images_dir, filename.replace(".svg", ".png"))
-            try:
-                cairosvg.svg2png(url=svg_path, write_to=png_path)
-                os.remove(svg_path)
-                logger.info(f"SVGをPNGに変換しました: {svg_path} -> {png_path}")
-            except Exception as e:
-                logger.error(f"SVGからPNGへの変換失敗: {svg_path} - {e}")
-
-def update_content_json(path, data, content_type):
-    with open(path, 'r', encoding='utf-8') as f:
-        content = json.load(f)
-    if content_type == 'dialog_cards' and 'cards' in data:
-        content['dialogs'] = []
-        for card in data['cards']:
-            dialog = {
-                'text': card.get('text', ''),
-                'answer': card.get('answer', '')
-            }
-            if 'tip' in card:
-                dialog['tips'] = card['tip']
-            if 'image' in card:
-                image_path = card['image'].get('path', '')
-                if image_path.lower().endswith('.svg'):
-                    image_path = re.sub(r'\.svg$', '.png', image_path)
-                dialog['image'] = {
-                    'path': image_path,
-                    'width': card['image'].get('width', 300),
-                    'height': card['image'].get('height', 300),
-                    'alt': card['image'].get('alt', '')
-                }
-            # audio フィールドを追加
-            if 'audio' in card:
-                dialog['audio'] = [{
-                    'path': card['audio'].get('path', ''),
-                    'mime': card['audio'].get('mime', '')
-                }]
-            content['dialogs'].append(dialog)
-        if 'title' in data:
-            content['title'] = data['title']
-        if 'description' in data:
-            content['description'] = data['description']
-        if 'behaviour' in data:
-            content['behaviour'] = data['behaviour']
-    unwanted_keys = [
-        "answer", "next", "prev", "retry", "correctAnswer", "incorrectAnswer",
-        "round", "cardsLeft", "nextRound", "startOver", "showSummary", "summary",
-        "summaryCardsRight", "summaryCardsWrong", "summaryCardsNotShown",
-        "summaryOverallScore", "summaryCardsCompleted", "summaryCompletedRounds",
-        "summaryAllDone", "progressText", "cardFrontLabel", "cardBackLabel",
-        "tipButtonLabel", "audioNotSupported", "confirmStartingOver"
-    ]
-    for key in unwanted_keys:
-        content.pop(key, None)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(content, f, ensure_ascii=False, indent=2)
+    svg_paths = [entry.path for entry in os.scandir(images_dir) if entry.name.endswith(".svg")]
+    if not svg_paths:
+        return
+    # ラスタライズはCPUを使うので、複数あれば別プロセスで並列に変換する
+    if len(svg_paths) == 1:
+        results = list(map(_svg_to_png, svg_paths))
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(svg_paths), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(_svg_to_png, svg_paths))
+    for svg_path, png_path, error in results:
+        if error is None:
+            logger.info(f"SVGをPNGに変換しました: {svg_path} -> {png_path}")
+        else:
+            logger.error(f"SVGからPNGへの変換失敗: {svg_path} - {error}")
+
+# Dialog Cards のテンプレートから取り除く文言キー
+_UNWANTED_KEYS = frozenset([
+    "answer", "next", "prev", "retry", "correctAnswer", "incorrectAnswer",
+    "round", "cardsLeft", "nextRound", "startOver", "showSummary", "summary",
+    "summaryCardsRight", "summaryCardsWrong", "summaryCardsNotShown",
+    "summaryOverallScore", "summaryCardsCompleted", "summaryCompletedRounds",
+    "summaryAllDone", "progressText", "cardFrontLabel", "cardBackLabel",
+    "tipButtonLabel", "audioNotSupported", "confirmStartingOver"
+])
+
+def updates_content(data, content_type):
+    """content.json に反映するデータがあるか（今のところ Dialog Cards のカードのみ）"""
+    return content_type == 'dialog_cards' and 'cards' in data
+
+def _mk_dialog(card):
+    """生成したカード1枚を Dialog Cards の dialog に変換する"""
+    dialog = {
+        'text': card.get('text', ''),
+        'answer': card.get('answer', '')
+    }
+    if 'tip' in card:
+        dialog['tips'] = card['tip']
+    image = card.get('image')
+    if image is not None:
+        image_path = image.get('path', '')
+        # SVGは convert_svg_to_png_in_dir でPNGに変換済み
+        if image_path.endswith('.svg'):
+            image_path = image_path[:-len('.svg')] + '.png'
+        dialog['image'] = {
+            'path': image_path,
+            'width': image.get('width', 300),
+            'height': image.get('height', 300),
+            'alt': image.get('alt', '')
+        }
+    # audio フィールドを追加
+    audio = card.get('audio')
+    if audio is not None:
+        dialog['audio'] = [{
+            'path': audio.get('path', ''),
+            'mime': audio.get('mime', '')
+        }]
+    return dialog
+
+def update_content(content, data, content_type):
+    """
+    テンプレートの content.json（読み込み済みのdict）に生成したデータを反映する。
+    書き換えた場合は True、何も変えなかった場合は False を返す。
+    """
+    if not updates_content(data, content_type):
+        return False
+    content['dialogs'] = [_mk_dialog(card) for card in data['cards']]
+    if 'title' in data:
+        content['title'] = data['title']
+    if 'description' in data:
+        content['description'] = data['description']
+    if 'behaviour' in data:
+        # テンプレートの設定を残したまま、生成側で指定した項目だけ上書きする
+        content.setdefault('behaviour', {}).update(data['behaviour'])
+    for key in _UNWANTED_KEYS & content.keys():
+        del content[key]
     return True
 
-def update_h5p_metadata(path, title):
-    with open(path, 'r', encoding='utf-8') as f:
-        metadata = json.load(f)
+def update_metadata(metadata, title):
+    """テンプレートの h5p.json（読み込み済みのdict）のタイトルと言語を書き換える"""
     metadata['title'] = title
     metadata['language'] = 'ja'
     metadata.pop('defaultLanguage', None)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
-    return True
+    return metadata
+
+# 圧縮率より速度を優先する（テキストでもレベル6と比べてサイズはほとんど変わらない）
+ZIP_COMPRESSLEVEL = 1
+
+def _compress_type(name):
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
 
-def create_h5p_package(json_file, content_type, templates_dir, output_dir):
-    template = find_template_h5p(content_type, templates_dir)
+def open_preallocated(path, size):
+    """
+    path を書き込み用に開き、size バイト分の領域を先に確保する（断片化を減らすため）。
+    確保した分はファイルサイズに含まれるので、書き終えたら truncate() すること。
+    posix_fallocate がない・使えないファイルシステムでは確保せずにそのまま開く。
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+    return os.fdopen(fd, 'wb')
+
+def package_filename(data, json_file):
+    """出力するH5Pのファイル名（タイトルから決まる）"""
+    title = data.get('title', json_file_stem(json_file))
+    return f"N5_{title}.h5p"
+
+def source_marker_path(output_file):
+    """output_file をどのJSONから作ったかを記録するファイル（ドットファイルなので find_json_files には拾われない）"""
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f".{name}.source")
+
+def read_source_marker(output_file):
+    try:
+        with open(source_marker_path(output_file), encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def write_source_marker(output_file, source):
+    marker = source_marker_path(output_file)
+    tmp_marker = marker + '.tmp'
+    with open(tmp_marker, 'w', encoding='utf-8') as f:
+        f.write(source)
+    os.replace(tmp_marker, marker)
+
+def create_h5p_package(json_file, content_type, templates_dir, output_dir, template=None, force=False):
+    if template is None:
+        template = find_template_h5p(content_type, templates_dir)
     if not template:
         logger.error("テンプレートが見つかりません")
         return None
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    title = data.get('title', Path(json_file).stem)
-    title = data.get('title', Path(json_file).stem)
-    base_filename = f"N5_{data.get('title', Path(json_file).stem)}.h5p"
+    data = load_json_file(json_file)
+    title = data.get('title', json_file_stem(json_file))
+    base_filename = package_filename(data, json_file)
 
-    # 既存ファイルがあればリネーム（日時付き）
     output_file = os.path.join(output_dir, base_filename)
-    if os.path.exists(output_file):
+
+    # 画像・音声は元の場所から直接zipに入れる（テンプレートに同名のファイルがあればこちらで置き換える）
+    media = {}
+    media_size = 0
+    input_mtime = max(os.stat(json_file).st_mtime_ns, os.stat(template).st_mtime_ns)
+    base_dir = os.path.dirname(json_file)
+    for folder in ('images', 'audios'):
+        src = os.path.join(base_dir, folder)
+        # 存在確認とは別に stat しないよう、フォルダがなければ scandir の例外で判定する
+        try:
+            if folder == 'images':
+                convert_svg_to_png_in_dir(src)
+            entries = list(os.scandir(src))
+            # ファイルの削除はフォルダの mtime に出る
+            input_mtime = max(input_mtime, os.stat(src).st_mtime_ns)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            media[f"content/{folder}/{entry.name}"] = entry.path
+            stat = entry.stat()
+            media_size += stat.st_size
+            input_mtime = max(input_mtime, stat.st_mtime_ns)
+
+    # 既存ファイルがあれば、入力（JSON・テンプレート・画像・音声）より新しいなら作り直さない
+    # 出力名はタイトルだけで決まるので、同じタイトルの別のJSONから作ったものでないことも確かめる
+    try:
+        output_mtime = os.stat(output_file).st_mtime_ns
+    except FileNotFoundError:
+        output_mtime = None
+    source = f"{os.path.abspath(json_file)}\n{os.path.abspath(template)}\n"
+    if (output_mtime is not None and not force and output_mtime >= input_mtime
+            and read_source_marker(output_file) == source):
+        logger.info(f"入力に変更がないためスキップ: {json_file} -> {output_file}")
+        return output_file
+
+    # テンプレートは展開せず、zipからzipへ infolist() の順にエントリ単位で書き写す
+    # 出力サイズはおおむね圧縮前の合計以下なので、その分を先に確保しておく（足りなければ普通に伸びる）
+    # 途中で失敗した壊れたファイルが「最新」とみなされないよう、一時ファイルに書き終えてから置き換える
+    template_entries = load_template_entries(template)
+    estimated_size = media_size + sum(len(payload) for _, payload in template_entries) + 4096
+    # 一時ファイル名はジョブごとに別にする（同じ出力名のジョブ同士で書き込みが混ざらないように）
+    fd, tmp_file = tempfile.mkstemp(dir=output_dir, prefix=f".{base_filename}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        with open_preallocated(tmp_file, estimated_size) as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESSLEVEL) as zipf:
+                _write_h5p_entries(zipf, template_entries, media, data, content_type, title)
+            f.truncate()
+        # mkstemp は所有者だけが読める権限で作るので、通常のファイルと同じ権限に戻す
+        os.chmod(tmp_file, 0o644)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+    # 既存ファイルは、新しいパッケージが書き上がってからリネームする（日時付き）
+    if output_mtime is not None:
         created_time = datetime.fromtimestamp(os.path.getctime(output_file)).strftime("%Y%m%d_%H%M%S")
         backup_name = f"{base_filename.replace('.h5p', '')}_{created_time}.h5p"
         backup_path = os.path.join(output_dir, backup_name)
         os.rename(output_file, backup_path)
         logger.info(f"既存ファイルをリネーム: {output_file} → {backup_path}")
+    os.replace(tmp_file, output_file)
+    write_source_marker(output_file, source)
+    logger.info(f"H5Pパッケージを作成しました: {json_file} -> {output_file}")
+    return output_file
 
+def _write_h5p_entries(zipf, template_entries, media, data, content_type, title):
+    """テンプレートのエントリ（content.json と h5p.json は書き換える）と画像・音声を zipf に書き込む"""
+    for info, payload in template_entries:
+        name = info.filename
+        if name in media:
+            continue
+        if name == 'content/content.json' and updates_content(data, content_type):
+            content = _load_json(payload)
+            update_content(content, data, content_type)
+            zipf.writestr(name, _dump_json_bytes(content, compact=True))
+        elif name == 'h5p.json':
+            metadata = update_metadata(_load_json(payload), title)
+            zipf.writestr(name, _dump_json_bytes(metadata, compact=True))
+        else:
+            # 書き換えないエントリは、テンプレートの日時・属性をそのまま引き継ぐ
+            out_info = zipfile.ZipInfo(name, date_time=info.date_time)
+            out_info.external_attr = info.external_attr
+            # テンプレートで無圧縮だったものは無圧縮のまま（圧縮済みのデータなので縮まない）
+            if info.compress_type == zipfile.ZIP_STORED:
+                out_info.compress_type = zipfile.ZIP_STORED
+            else:
+                out_info.compress_type = _compress_type(name)
+            zipf.writestr(out_info, payload, compresslevel=ZIP_COMPRESSLEVEL)
+    for arcname, path in media.items():
+        zipf.write(path, arcname, compress_type=_compress_type(arcname))
 
-    with tempfile.TemporaryDirectory() as tmp:
-        with zipfile.ZipFile(template, 'r') as zip_ref:
-            zip_ref.extractall(tmp)
-        update_content_json(os.path.join(tmp, 'content', 'content.json'), data, content_type)
-        update_h5p_metadata(os.path.join(tmp, 'h5p.json'), title)
-        img_src = os.path.join(os.path.dirname(json_file), 'images')
-        img_dst = os.path.join(tmp, 'content', 'images')
-        if os.path.exists(img_src):
-            convert_svg_to_png_in_dir(img_src)
-            os.makedirs(img_dst, exist_ok=True)
-            for img in os.listdir(img_src):
-                shutil.copy2(os.path.join(img_src, img), os.path.join(img_dst, img))
-
-        audio_src = os.path.join(os.path.dirname(json_file), 'audios')
-        audio_dst = os.path.join(tmp, 'content', 'audios')
-        if os.path.exists(audio_src):
-            os.makedirs(audio_dst, exist_ok=True)
-            for aud in os.listdir(audio_src):
-                shutil.copy2(os.path.join(audio_src, aud), os.path.join(audio_dst, aud))
-
-        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(tmp):
-                for file in files:
-                    zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), tmp))
-    return output_file
+def process_json_file(json_file, templates_dir, output_dir, force=False):
+    """1つのJSONファイルからH5Pパッケージを作る（スレッドプールのワーカーから呼ばれる）"""
+    try:
+        content_type = determine_content_type(json_file)
+        template = find_template_h5p(content_type, templates_dir)
+        return create_h5p_package(json_file, content_type, templates_dir, output_dir, template, force)
+    except Exception as e:
+        logger.error(f"{json_file} の処理中にエラー: {e}", exc_info=True)
+        return None
 
-def main():
-    args = parse_arguments()
-    os.makedirs(args.output_dir, exist_ok=True)
-    json_files = find_json_files(args.input_dir)
+def process_json_files(json_files, templates_dir, output_dir, force=False):
+    """出力名が同じJSONファイルを順に処理する（同じ出力ファイルを並列に書き換えないように）"""
+    output_files = []
+    for json_file in json_files:
+        output_file = process_json_file(json_file, templates_dir, output_dir, force)
+        if output_file and output_file not in output_files:
+            output_files.append(output_file)
+    return output_files
+
+def group_by_output_name(json_files):
+    """JSONファイルを出力名ごとにまとめる（読めないファイルはそれだけで1グループにし、処理時にエラーを出す）"""
+    groups = {}
     for json_file in json_files:
         try:
-            content_type = determine_content_type(json_file)
-            create_h5p_package(json_file, content_type, args.templates_dir, args.output_dir)
-        except Exception as e:
-            logger.error(f"{json_file} の処理中にエラー: {e}", exc_info=True)
+            key = package_filename(load_json_file(json_file), json_file)
+        except Exception:
+            key = json_file
+        groups.setdefault(key, []).append(json_file)
+    for name, files in groups.items():
+        if len(files) > 1:
+            logger.warning(f"同じ出力名 {name} になるJSONが複数あります（順に処理し、後のものが残ります）: {files}")
+    return list(groups.values())
+
+def run(input_dir, output_dir, templates_dir='src/templates', json_files=None, jobs=None, processes=False,
+        force=False):
+    """
+    input_dir のJSONをH5Pパッケージにして、作成したファイルのパスのリストを返す。
+    json_files を渡した場合はそのファイルだけを処理する（run_all.py から呼ばれる）。
+    processes=True ならプロセスプールで処理する（テンプレートのキャッシュはプロセスごとに持つ）。
+    force=True なら入力に変更がないパッケージも作り直す。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if json_files is None:
+        json_files = find_json_files(input_dir)
+
+    # worker.py や run_all.py から繰り返し呼ばれる間にテンプレートが追加・削除されることがあるので、
+    # テンプレートの一覧は run() ごとに作り直す（1回の run() の中では使い回す）
+    list_templates_h5p.cache_clear()
+    find_template_h5p.cache_clear()
+
+    # 同じ images フォルダを複数のワーカーが同時に変換しないよう、SVGは先にまとめてPNGにしておく
+    for images_dir in {os.path.join(os.path.dirname(f), 'images') for f in json_files}:
+        try:
+            convert_svg_to_png_in_dir(images_dir)
+        except FileNotFoundError:
+            pass
+
+    # ファイルごとに並列に処理する（zlibの圧縮やファイルI/OはGILを手放すので、通常はスレッドで足りる）
+    output_files = []
+    if not json_files:
+        return output_files
+    # 同じタイトルのJSONは同じファイルに出力されるので、出力名ごとに1つのジョブにまとめる
+    groups = group_by_output_name(json_files)
+    worker = partial(process_json_files, templates_dir=templates_dir, output_dir=output_dir, force=force)
+    if processes:
+        executor_class = ProcessPoolExecutor
+        default_jobs = os.cpu_count() or 1
+    else:
+        executor_class = ThreadPoolExecutor
+        default_jobs = min(32, (os.cpu_count() or 1) * 4)
+    max_workers = max(1, min(jobs or default_jobs, len(groups)))
+    with executor_class(max_workers=max_workers) as executor:
+        futures = [executor.submit(worker, group) for group in groups]
+        for future in as_completed(futures):
+            output_files.extend(future.result())
+    return output_files
+
+def main():
+    args = parse_arguments()
+    run(args.input_dir, args.output_dir, args.templates_dir, jobs=args.jobs, processes=args.processes,
+        force=args.force)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+APIのレート制限（1分あたりのリクエスト数・トークン数）を送信側で守るための実行ヘルパー
+openai-cookbook の api_request_parallel_processor.py と同じく、容量を時間経過で回復させ、
+容量が足りるまで待ってから送信することで、429を受けてから待つよりも無駄なく流す。
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from openai import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """429（レート制限）によるエラーかどうか"""
+    if isinstance(error, RateLimitError):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+class RateLimiter:
+    """
+    リクエスト数とトークン数の2つの容量を持つトークンバケット。
+    tokens_per_minute を指定しない場合はリクエスト数だけを制限する。
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.max_request_capacity = max(1.0, requests_per_minute)
+        self.max_token_capacity = tokens_per_minute if tokens_per_minute else math.inf
+        self.available_request_capacity = self.max_request_capacity
+        self.available_token_capacity = self.max_token_capacity
+        self.last_update_time = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update_time
+        self.available_request_capacity = min(
+            self.max_request_capacity,
+            self.available_request_capacity + elapsed * self.max_request_capacity / 60.0
+        )
+        self.available_token_capacity = min(
+            self.max_token_capacity,
+            self.available_token_capacity + elapsed * self.max_token_capacity / 60.0
+        )
+        self.last_update_time = now
+
+    async def acquire(self, token_estimate: int = 0):
+        """リクエスト1件分と token_estimate トークン分の容量が空くまで待ってから消費する"""
+        tokens = min(token_estimate, self.max_token_capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= tokens
+                    return
+                # 足りない方の容量が回復するまでの時間だけ待つ
+                wait = (1 - self.available_request_capacity) * 60.0 / self.max_request_capacity
+                if self.available_token_capacity < tokens:
+                    wait = max(wait, (tokens - self.available_token_capacity) * 60.0 / self.max_token_capacity)
+                await asyncio.sleep(max(wait, 0.01))
+
+    async def submit(self, request: Callable[[], Awaitable[Any]], token_estimate: int = 0,
+                     max_attempts: int = 3) -> Any:
+        """
+        容量を確保してから request() を実行する。
+        それでも429を受けた場合だけ 2**attempt 秒＋ゆらぎ だけ待って再送する（最大 max_attempts 回）。
+        再送のたびに新しいリクエストを作れるよう、コルーチンではなく関数を受け取る。
+        """
+        for attempt in range(max_attempts):
+            await self.acquire(token_estimate)
+            try:
+                return await request()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == max_attempts - 1:
+                    raise
+                delay = 2 ** attempt + random.uniform(0, 1)
+                logger.warning(f"レート制限を受けました。{delay:.1f}秒待って再送します (試行 {attempt + 1}/{max_attempts})")
+                await asyncio.sleep(delay)
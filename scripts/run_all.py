@@ -1,9 +1,17 @@
 import subprocess
 import argparse
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+import json_to_h5p
+
+# 生成中の出力フォルダを見に行く間隔（秒）
+WATCH_INTERVAL = 0.5
+
 def run_generate_content(content_type, task_file, lesson_id, output_dir, test=False, test_chars=None):
     cmd = [
         "python", "generate_content.py",
@@ -16,16 +24,45 @@ def run_generate_content(content_type, task_file, lesson_id, output_dir, test=Fa
         cmd.append("--test")
         if test_chars:
             cmd.extend(["--test_chars", test_chars])
-    subprocess.run(cmd, check=True)
+    # 終了を待たずに返し、生成中に出てきたJSONから順にH5Pへ変換できるようにする
+    return subprocess.Popen(cmd)
 
-def run_json_to_h5p(input_dir, h5p_output_dir, templates_dir="../src/templates"):
-    cmd = [
-        "python", "json_to_h5p.py",
-        "--input_dir", input_dir,
-        "--output_dir", h5p_output_dir,
-        "--templates_dir", templates_dir
-    ]
-    subprocess.run(cmd, check=True)
+def run_generate_content_in_worker(content_type, task_file, lesson_id, output_dir, test=False, test_chars=None):
+    """
+    generate_content を worker.py 経由で実行する（Popen と同じく終了を待たずに返す）。
+    コマンドを送って標準入力を閉じると、ワーカーは処理を終えてから終了する（失敗時の終了コードは1）。
+    """
+    options = {
+        "lesson_id": lesson_id,
+        "content_type": content_type,
+        "task_file": task_file,
+        "output_dir": output_dir,
+        "test": test,
+        "test_chars": test_chars if test else None,
+    }
+    process = subprocess.Popen(["python", "-u", "worker.py"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                               text=True, encoding="utf-8")
+    process.stdin.write(json.dumps({"cmd": "generate", "args": options}, ensure_ascii=False) + "\n")
+    process.stdin.close()
+    return process
+
+def watch_json_to_h5p(input_dir, h5p_output_dir, templates_dir, done):
+    """
+    generate_content.py の実行中に input_dir を監視し、出力されたJSONから順にH5Pを作る。
+    JSONは一時ファイルに書いてから os.replace で置かれるので、見えた時点で書き込みは終わっている。
+    done がセットされたら、最後にもう一度だけ見て終わる。
+    """
+    converted = set()
+    while True:
+        finished = done.is_set()
+        new_files = [f for f in json_to_h5p.find_json_files(input_dir) if f not in converted]
+        if new_files:
+            converted.update(new_files)
+            # 別プロセスを起こさずに同じプロセスで変換する（テンプレートのキャッシュも使い回せる）
+            json_to_h5p.run(input_dir, h5p_output_dir, templates_dir, json_files=new_files)
+        if finished:
+            return
+        done.wait(WATCH_INTERVAL)
 
 def main():
     parser = argparse.ArgumentParser(description="Run generate_content.py and json_to_h5p.py in sequence.")
@@ -35,6 +72,7 @@ def main():
     parser.add_argument("--h5p_output_dir", default="h5p_output", help="H5P出力フォルダ（共通保存先）")
     parser.add_argument("--test", action="store_true", help="テストモード")
     parser.add_argument("--test_chars", type=str, help="テスト用文字")
+    parser.add_argument("--worker", action="store_true", help="Step 1 を worker.py 経由で実行する")
 
     args = parser.parse_args()
 
@@ -43,8 +81,13 @@ def main():
     working_dir = Path("src/content") / f"content_{timestamp}"
     working_dir.mkdir(parents=True, exist_ok=True)
 
+    h5p_output_dir = Path(args.h5p_output_dir).resolve()
+    h5p_output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Step 1 と Step 2 は重ねて実行する（Step 1 が出力したJSONから順に Step 2 で変換する）
     print(f"=== Step 1: Generating JSON content (lesson_id: {lesson_id}) ===")
-    run_generate_content(
+    start_generate = run_generate_content_in_worker if args.worker else run_generate_content
+    process = start_generate(
         content_type=args.content_type,
         task_file=args.task_file,
         lesson_id=lesson_id,
@@ -54,14 +97,21 @@ def main():
     )
 
     print(f"=== Step 2: Converting JSON to H5P ===")
-    h5p_output_dir = Path(args.h5p_output_dir).resolve()
-    h5p_output_dir.mkdir(parents=True, exist_ok=True)
-
-    run_json_to_h5p(
-        input_dir=str(working_dir),
-        h5p_output_dir=str(h5p_output_dir),
-        templates_dir=args.templates_dir
-    )
+    done = threading.Event()
+    # 変換中の例外を future に受け取り、Step 1 の終了後にこのスレッドで投げ直す
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        watcher = executor.submit(
+            watch_json_to_h5p, str(working_dir), str(h5p_output_dir), args.templates_dir, done
+        )
+        try:
+            returncode = process.wait()
+        finally:
+            done.set()
+    watch_error = watcher.exception()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, process.args) from watch_error
+    if watch_error is not None:
+        raise watch_error
 
     print(f"✅ Done! H5P saved to: {h5p_output_dir}")
     print(f"📁 Intermediate files are in: {working_dir}")
@@ -7,13 +7,22 @@ Moodle Web Services APIを使用
 import os
 import json
 import argparse
+import hashlib
 import logging
 import requests
 import time
 import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from requests_toolbelt import MultipartEncoder
+except ImportError:  # requests_toolbelt がなければ大きなファイルも通常どおりメモリに載せて送る
+    MultipartEncoder = None
 
 # ロギング設定
 logging.basicConfig(
@@ -25,6 +34,91 @@ logger = logging.getLogger(__name__)
 # 環境変数のロード
 load_dotenv()
 
+# 同時にアップロードするファイル数
+UPLOAD_WORKERS = 4
+
+# アクティビティ作成を1回のリクエストにまとめる件数
+ACTIVITY_BATCH_SIZE = 8
+
+# まとめた呼び出しが使えない（何も実行されていない）ことを表すMoodleのエラーコード
+# （サービスに関数が追加されていない・関数が存在しない・サービスが無効）
+BATCH_UNAVAILABLE_ERRORCODES = frozenset({'accessexception', 'invalidrecord', 'servicenotavailable'})
+
+# APIアクセス確認の結果を使い回す時間（秒）
+SITE_INFO_TTL = 300
+
+# これより大きいファイルは本文全体をメモリに載せず、少しずつ読みながら送る
+STREAM_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+
+# 少しずつ送るアップロードを 429 / 503 で送り直す回数の上限
+STREAM_UPLOAD_ATTEMPTS = 5
+
+
+class RequestThrottle:
+    """スレッド間で共有する、1秒あたりのリクエスト数の上限（rps を指定しなければ制限しない）"""
+
+    def __init__(self, rps=None):
+        self.interval = 1.0 / rps if rps else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """前のリクエストから 1/rps 秒空くまで待つ"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ThrottledSession(requests.Session):
+    """送信前に throttle で間隔を空けるセッション"""
+
+    def __init__(self):
+        super().__init__()
+        self.throttle = RequestThrottle()
+
+    def request(self, *args, **kwargs):
+        self.throttle.wait()
+        return super().request(*args, **kwargs)
+
+
+def make_session(max_retries):
+    """接続を使い回すセッションを作る（TLSハンドシェイクは最初の1回だけで済む）"""
+    session = ThrottledSession()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# 何度送っても結果が変わらない呼び出し（ドラフトへのアップロード、サイト情報の取得）用。
+# 429や5xxが返ってきた場合は、Retry-After か指数バックオフの分だけ待って再送する（POSTも対象）
+SESSION = make_session(Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=frozenset({'GET', 'POST'}),
+    respect_retry_after_header=True
+))
+
+# アクティビティ作成用。5xxはサーバー側で作成済みかもしれず、送り直すと重複するので再送しない。
+# 処理されていないことがはっきりしている 429 と、Retry-After 付きの 503 だけ送り直す
+WRITE_SESSION = make_session(Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429],
+    allowed_methods=frozenset({'POST'}),
+    respect_retry_after_header=True
+))
+
+# 少しずつ送るアップロード用。本文のストリームは巻き戻せないので、セッションでは再送しない
+# （送り直しは post_streamed_upload がファイルを先頭に戻してから行う）
+STREAM_SESSION = make_session(0)
+
 
 def parse_arguments():
     """コマンドライン引数をパースする"""
@@ -39,16 +133,15 @@ def parse_arguments():
                         help='MoodleサーバーのURL（指定がない場合は環境変数から取得）')
     parser.add_argument('--token', type=str,
                         help='Moodle APIトークン（指定がない場合は環境変数から取得）')
+    parser.add_argument('--rate_limit_rps', type=float,
+                        help='1秒あたりのリクエスト数の上限（指定がない場合は制限せず、429を受けたときだけ待つ）')
     return parser.parse_args()
 
 
 def find_h5p_files(h5p_dir):
     """指定ディレクトリからH5Pファイルを検索する"""
-    h5p_files = []
-    for file in os.listdir(h5p_dir):
-        if file.endswith('.h5p'):
-            h5p_files.append(os.path.join(h5p_dir, file))
-    return h5p_files
+    return [entry.path for entry in os.scandir(h5p_dir)
+            if entry.name.endswith('.h5p') and entry.is_file()]
 
 
 def get_config():
@@ -80,14 +173,13 @@ def upload_file_to_moodle(file_path, moodle_url, token):
         'token': token
     }
 
-    # ファイルを開いてmultipart/form-dataでアップロード
-    files = {
-        'file': (file_name, open(file_path, 'rb'))
-    }
-
     try:
-        # POSTリクエストを送信
-        response = requests.post(endpoint, data=data, files=files)
+        # ファイルを開いてmultipart/form-dataでアップロード（例外時もファイルは閉じる）
+        with open(file_path, 'rb') as fh:
+            if MultipartEncoder is not None and os.fstat(fh.fileno()).st_size > STREAM_UPLOAD_THRESHOLD:
+                response = post_streamed_upload(endpoint, data, file_name, fh)
+            else:
+                response = SESSION.post(endpoint, data=data, files={'file': (file_name, fh, 'application/zip')})
 
         # レスポンスのチェック
         if response.status_code == 200:
@@ -108,19 +200,11 @@ def upload_file_to_moodle(file_path, moodle_url, token):
     return None
 
 
-def create_h5p_activity(item_id, file_name, course_id, section_id, moodle_url, token):
-    """アップロードされたH5PファイルからH5Pアクティビティを作成する"""
-    # エンドポイントを構築
-    endpoint = urljoin(moodle_url, '/webservice/rest/server.php')
-
+def activity_arguments(item_id, file_name, course_id, section_id):
+    """mod_h5pactivity_add_instance に渡す引数"""
     # タイトルをファイル名から取得（.h5pを削除）
     title = os.path.splitext(file_name)[0]
-
-    # リクエストデータの準備
-    data = {
-        'wstoken': token,
-        'wsfunction': 'mod_h5pactivity_add_instance',
-        'moodlewsrestformat': 'json',
+    return {
         'h5pactivity': {
             'course': course_id,
             'name': title,
@@ -133,9 +217,48 @@ def create_h5p_activity(item_id, file_name, course_id, section_id, moodle_url, t
         'h5pfile': item_id
     }
 
+
+def post_streamed_upload(endpoint, data, file_name, fh):
+    """
+    MultipartEncoder でファイルを少しずつ読みながら送る。
+    429 と Retry-After 付きの 503 のときだけ、ファイルを先頭に戻して本文を作り直してから送り直す。
+    """
+    for attempt in range(STREAM_UPLOAD_ATTEMPTS):
+        fh.seek(0)
+        encoder = MultipartEncoder(fields={**data, 'file': (file_name, fh, 'application/zip')})
+        response = STREAM_SESSION.post(endpoint, data=encoder, headers={'Content-Type': encoder.content_type})
+        retry_after = response.headers.get('Retry-After')
+        retryable = response.status_code == 429 or (response.status_code == 503 and retry_after)
+        if not retryable or attempt == STREAM_UPLOAD_ATTEMPTS - 1:
+            return response
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):  # 指定がない・日時形式の場合は指数バックオフ
+            delay = 0.5 * 2 ** attempt
+        logger.warning(f"アップロードが制限されました。{delay:.1f}秒待って再送します: {file_name} "
+                       f"(試行 {attempt + 1}/{STREAM_UPLOAD_ATTEMPTS})")
+        time.sleep(delay)
+    return response
+
+
+def create_h5p_activity(item_id, file_name, course_id, section_id, moodle_url, token):
+    """アップロードされたH5PファイルからH5Pアクティビティを作成する"""
+    # エンドポイントを構築
+    endpoint = urljoin(moodle_url, '/webservice/rest/server.php')
+
+    title = os.path.splitext(file_name)[0]
+
+    # リクエストデータの準備
+    data = {
+        'wstoken': token,
+        'wsfunction': 'mod_h5pactivity_add_instance',
+        'moodlewsrestformat': 'json',
+        **activity_arguments(item_id, file_name, course_id, section_id)
+    }
+
     try:
         # POSTリクエストを送信
-        response = requests.post(endpoint, data=data)
+        response = WRITE_SESSION.post(endpoint, data=data)
 
         # レスポンスのチェック
         if response.status_code == 200:
@@ -158,8 +281,101 @@ def create_h5p_activity(item_id, file_name, course_id, section_id, moodle_url, t
     return None
 
 
+def create_h5p_activities_batch(items, course_id, section_id, moodle_url, token):
+    """
+    tool_mobile_call_external_functions で複数のアクティビティ作成を1回のリクエストにまとめる。
+    items は (item_id, file_name) のリスト。作成したアクティビティIDのリスト（失敗した分は None）を返す。
+    サーバーがまとめた呼び出し自体をはっきり拒否した場合（サービスに関数が追加されていないなど）だけ None を返す。
+    タイムアウトや5xxなど、サーバー側で作成済みかどうか分からない失敗は、1件ずつ作り直すと重複しうるので
+    全件失敗として返す。
+    """
+    endpoint = urljoin(moodle_url, '/webservice/rest/server.php')
+
+    data = {
+        'wstoken': token,
+        'wsfunction': 'tool_mobile_call_external_functions',
+        'moodlewsrestformat': 'json',
+    }
+    for i, (item_id, file_name) in enumerate(items):
+        data[f'requests[{i}][function]'] = 'mod_h5pactivity_add_instance'
+        data[f'requests[{i}][arguments]'] = json.dumps(
+            activity_arguments(item_id, file_name, course_id, section_id), ensure_ascii=False)
+        data[f'requests[{i}][settingfilter]'] = 1
+
+    failed = [None] * len(items)
+    try:
+        response = WRITE_SESSION.post(endpoint, data=data)
+    except Exception as e:
+        logger.error(f"H5Pアクティビティのまとめての作成中に例外が発生しました（作成済みの可能性があります）: {e}")
+        return failed
+    if response.status_code != 200:
+        logger.error(f"H5Pアクティビティ作成エラー: ステータスコード {response.status_code} - {response.text}")
+        return failed
+    try:
+        result = response.json()
+    except ValueError:
+        logger.error(f"H5Pアクティビティ作成エラー: JSONデコードに失敗 - {response.text}")
+        return failed
+    if isinstance(result, dict) and 'exception' in result:
+        if result.get('errorcode') in BATCH_UNAVAILABLE_ERRORCODES:
+            logger.warning(f"アクティビティ作成をまとめて送れませんでした: {result.get('message', 'Unknown error')}")
+            return None
+        logger.error(f"H5Pアクティビティ作成エラー: {result.get('message', 'Unknown error')}")
+        return failed
+    if not isinstance(result, dict) or 'responses' not in result:
+        logger.error(f"H5Pアクティビティ作成エラー: 不正なレスポンス - {response.text}")
+        return failed
+
+    # 応答は要求と同じ順に並ぶ（data・exception はJSON文字列）
+    h5p_ids = []
+    responses = result['responses']
+    for i, (item_id, file_name) in enumerate(items):
+        title = os.path.splitext(file_name)[0]
+        entry = responses[i] if i < len(responses) else {'error': True, 'exception': '応答がありません'}
+        if entry.get('error'):
+            logger.error(f"H5Pアクティビティ作成エラー: {title} - {entry.get('exception')}")
+            h5p_ids.append(None)
+            continue
+        try:
+            h5p_id = json.loads(entry.get('data') or '{}').get('h5pactivityid')
+        except (ValueError, AttributeError):
+            h5p_id = None
+        if h5p_id:
+            logger.info(f"H5Pアクティビティが作成されました: ID={h5p_id}, タイトル={title}")
+        else:
+            logger.error(f"H5Pアクティビティ作成エラー: 不正なレスポンス - {entry.get('data')}")
+        h5p_ids.append(h5p_id)
+    return h5p_ids
+
+
+def create_h5p_activities(items, config):
+    """
+    アップロード済みの (item_id, file_name) からアクティビティを作成し、IDのリスト（失敗した分は None）を返す。
+    ACTIVITY_BATCH_SIZE 件ずつまとめて送り、サーバーがまとめた呼び出しを拒否したら1件ずつの作成に切り替える。
+    """
+    h5p_ids = []
+    batched = True
+    for start in range(0, len(items), ACTIVITY_BATCH_SIZE):
+        batch = items[start:start + ACTIVITY_BATCH_SIZE]
+        results = None
+        if batched:
+            results = create_h5p_activities_batch(
+                batch, config['course_id'], config['section_id'], config['moodle_url'], config['token'])
+            if results is None:
+                logger.info("以降は1件ずつアクティビティを作成します")
+                batched = False
+        if results is None:
+            results = [
+                create_h5p_activity(item_id, file_name, config['course_id'], config['section_id'],
+                                    config['moodle_url'], config['token'])
+                for item_id, file_name in batch
+            ]
+        h5p_ids.extend(results)
+    return h5p_ids
+
+
 def check_api_access(moodle_url, token):
-    """Moodle APIへのアクセスをチェック"""
+    """Moodle APIへのアクセスをチェックし、成功したらサイト情報を返す（失敗したら None）"""
     endpoint = urljoin(moodle_url, '/webservice/rest/server.php')
 
     data = {
@@ -169,21 +385,67 @@ def check_api_access(moodle_url, token):
     }
 
     try:
-        response = requests.post(endpoint, data=data)
+        response = SESSION.post(endpoint, data=data)
         if response.status_code == 200:
             result = response.json()
             if 'exception' in result:
                 logger.error(f"APIアクセスエラー: {result.get('message', 'Unknown error')}")
-                return False
+                return None
             else:
                 logger.info(f"Moodle APIアクセス成功: サイト名 {result.get('sitename', 'Unknown site')}")
-                return True
+                return result
         else:
             logger.error(f"APIアクセスエラー: ステータスコード {response.status_code}")
-            return False
+            return None
     except Exception as e:
         logger.error(f"APIアクセスチェック中に例外が発生しました: {e}")
+        return None
+
+
+def site_info_cache_path(moodle_url, token):
+    """APIアクセス確認の結果を置くファイル（$XDG_CACHE_HOME/upload_to_moodle/ 以下、URLとトークンごと）"""
+    cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = hashlib.blake2b(f"{moodle_url}|{token}".encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(cache_home, 'upload_to_moodle', f"{key}.json")
+
+
+def check_api_access_cached(moodle_url, token):
+    """
+    SITE_INFO_TTL 秒以内に同じURL・トークンで確認済みなら、APIを呼ばずに成功とみなす。
+    そうでなければ check_api_access で確認し、成功したら結果を保存する。
+    """
+    cache_path = site_info_cache_path(moodle_url, token)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached['ts'] < SITE_INFO_TTL:
+            logger.info(f"Moodle APIアクセス確認済み（キャッシュ）: サイト名 {cached.get('sitename', 'Unknown site')}")
+            return True
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    site_info = check_api_access(moodle_url, token)
+    if not site_info:
         return False
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'ts': time.time(), 'sitename': site_info.get('sitename')}, f, ensure_ascii=False)
+    except OSError as e:
+        logger.warning(f"APIアクセス確認結果を保存できませんでした: {e}")
+    return True
+
+
+def upload_h5p_file(h5p_file, config):
+    """1つのH5Pファイルをドラフトエリアにアップロードし、item id を返す（失敗したら None）"""
+    file_name = os.path.basename(h5p_file)
+    logger.info(f"処理中: {file_name}")
+
+    item_id = upload_file_to_moodle(h5p_file, config['moodle_url'], config['token'])
+    if not item_id:
+        logger.error(f"ファイルのアップロードに失敗しました: {file_name}")
+        return None
+    return item_id
 
 
 def main():
@@ -204,9 +466,14 @@ def main():
         config['course_id'] = args.course_id
     if args.section_id:
         config['section_id'] = args.section_id
+    if args.rate_limit_rps:
+        # 上限はすべてのセッションを合わせた数にする
+        throttle = RequestThrottle(args.rate_limit_rps)
+        for session in (SESSION, WRITE_SESSION, STREAM_SESSION):
+            session.throttle = throttle
 
     # APIアクセスをチェック
-    if not check_api_access(config['moodle_url'], config['token']):
+    if not check_api_access_cached(config['moodle_url'], config['token']):
         logger.error("Moodle APIへのアクセスに失敗しました。トークンとURLを確認してください。")
         return
 
@@ -216,38 +483,16 @@ def main():
         logger.warning(f"ディレクトリにH5Pファイルが見つかりませんでした: {args.h5p_dir}")
         return
 
-    # 各H5Pファイルを処理
-    successful_uploads = 0
-    failed_uploads = 0
-
-    for h5p_file in h5p_files:
-        file_name = os.path.basename(h5p_file)
-        logger.info(f"処理中: {file_name}")
-
-        # ファイルをアップロード
-        item_id = upload_file_to_moodle(h5p_file, config['moodle_url'], config['token'])
-        if not item_id:
-            logger.error(f"ファイルのアップロードに失敗しました: {file_name}")
-            failed_uploads += 1
-            continue
-
-        # H5Pアクティビティを作成
-        h5p_id = create_h5p_activity(
-            item_id,
-            file_name,
-            config['course_id'],
-            config['section_id'],
-            config['moodle_url'],
-            config['token']
-        )
-
-        if h5p_id:
-            successful_uploads += 1
-        else:
-            failed_uploads += 1
+    # 各H5Pファイルを並列にアップロード（レート制限にはセッションの再送で対応する）
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        item_ids = list(executor.map(lambda h5p_file: upload_h5p_file(h5p_file, config), h5p_files))
+    uploaded = [(item_id, os.path.basename(h5p_file))
+                for h5p_file, item_id in zip(h5p_files, item_ids) if item_id]
 
-        # APIレート制限を避けるため少し待機
-        time.sleep(1)
+    # H5Pアクティビティをまとめて作成
+    h5p_ids = create_h5p_activities(uploaded, config)
+    successful_uploads = sum(1 for h5p_id in h5p_ids if h5p_id)
+    failed_uploads = len(h5p_files) - successful_uploads
 
     # 結果の表示
     logger.info(f"アップロード完了: 成功={successful_uploads}, 失敗={failed_uploads}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+generate_content.py / json_to_h5p.py を1つのプロセスで続けて実行するワーカー
+標準入力から1行1コマンドのJSON（NDJSON）を読み、処理するたびに結果を1行のJSONで標準出力に返す。
+起動とモジュールの読み込みは最初の1回だけなので、run_all.py を繰り返し実行する場合や
+CIで何度も作り直す場合に、コマンドごとのPython起動コストがかからない。
+
+コマンド:
+  {"cmd": "generate", "args": {"lesson_id": "hiragana", "content_type": "dialog_cards", "output_dir": "...", "test": true}}
+      generate_content.py に同じ名前のオプションを渡して実行する（true はフラグ、false / null は省略）
+      キャッシュの指定も毎回のコマンドごと（例: "no_cache": true, "semantic_cache": true）
+  {"cmd": "h5p", "args": {"input_dir": "...", "output_dir": "...", "templates_dir": "..."}}
+      json_to_h5p.run() をキーワード引数で呼ぶ
+
+応答:
+  {"ok": true, "result": ...} または {"ok": false, "error": "..."}
+
+標準入力が閉じられたら終了する。失敗したコマンドが1つでもあれば終了コードは1。
+"""
+
+import sys
+import json
+import asyncio
+import logging
+import contextlib
+
+import generate_content
+import json_to_h5p
+
+logger = logging.getLogger(__name__)
+
+
+def to_argv(options):
+    """{"lesson_id": "x", "test": true} を ["--lesson_id", "x", "--test"] にする"""
+    argv = []
+    for key, value in options.items():
+        if value is None or value is False:
+            continue
+        argv.append(f"--{key}")
+        if value is not True:
+            argv.append(str(value))
+    return argv
+
+
+def run_command(loop, command):
+    """1つのコマンドを実行して結果を返す"""
+    cmd = command.get("cmd")
+    args = command.get("args") or {}
+    if cmd == "generate":
+        # 非同期クライアントやロックは最初のイベントループに結び付くので、同じループで実行し続ける
+        loop.run_until_complete(generate_content.main(to_argv(args)))
+        return None
+    if cmd == "h5p":
+        return json_to_h5p.run(**args)
+    raise ValueError(f"不明なコマンドです: {cmd}")
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    responses = sys.stdout
+    failed = False
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+                # 各スクリプトの print が応答に混ざらないよう、実行中の標準出力は標準エラーに回す
+                with contextlib.redirect_stdout(sys.stderr):
+                    result = run_command(loop, command)
+                response = {"ok": True, "result": result}
+            except BaseException as e:  # argparse や generate_content の SystemExit も失敗として返す
+                if isinstance(e, KeyboardInterrupt):
+                    raise
+                logger.error(f"コマンドの実行に失敗しました: {e}", exc_info=not isinstance(e, SystemExit))
+                response = {"ok": False, "error": str(e)}
+                failed = True
+            responses.write(json.dumps(response, ensure_ascii=False) + "\n")
+            responses.flush()
+    finally:
+        loop.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())